@@ -1,90 +1,159 @@
 #!/usr/bin/env python3
 
+import argparse
+import logging
 import time
-import can
-from src.configure import load_endpoints, read_config
 from src.control import set_idle_mode
-from src.can_utils import discover_node_ids, send_can_message
-
-# ODrive states mapped to descriptions
-ODRIVE_STATES = {
-    1: "IDLE",
-    2: "STARTUP_SEQUENCE",
-    3: "FULL_CALIBRATION",
-    4: "MOTOR_CALIBRATION",
-    6: "ENCODER_INDEX_SEARCH",
-    7: "ENCODER_OFFSET_CALIBRATION",
-    8: "CLOSED_LOOP_CONTROL",
-}
-
-def calibrate_motor(bus, node_id, endpoints):
+from src.can_utils import HEARTBEAT, discover_node_ids, send_can_message, get_bus, shutdown_bus, get_struct
+
+log = logging.getLogger(__name__)
+
+# ODrive states indexed by state code; unused codes map to "UNKNOWN"
+ODRIVE_STATES = (
+    "UNKNOWN",                     # 0
+    "IDLE",                        # 1
+    "STARTUP_SEQUENCE",            # 2
+    "FULL_CALIBRATION",            # 3
+    "MOTOR_CALIBRATION",           # 4
+    "UNKNOWN",                     # 5
+    "ENCODER_INDEX_SEARCH",        # 6
+    "ENCODER_OFFSET_CALIBRATION",  # 7
+    "CLOSED_LOOP_CONTROL",         # 8
+)
+
+# Heartbeat payload: axis_error (uint32), axis_state (uint8), procedure_result (uint8), ...
+HEARTBEAT_STRUCT = get_struct('<IBB')
+PROCEDURE_SUCCESS = 0
+PROCEDURE_BUSY = 1
+
+def wait_for_calibration(bus, node_ids, timeout=15):
     """
-    Runs encoder offset calibration for a single motor and waits for it to complete.
+    Waits for calibration to finish on every node in node_ids, using their heartbeat frames.
+    Returns a dictionary of {node_id: True/False}; False for nodes that failed or timed out.
     """
-    try:
-        print(f"Starting calibration for node {node_id}...")
-
-        # Send calibration command
-        send_can_message(bus, node_id, 0x07, '<I', 3)  # Command for full calibration
-
-        # Endpoint details for axis0.current_state
-        state_endpoint_id = endpoints["endpoints"]["axis0.current_state"]["id"]
-        state_endpoint_type = endpoints["endpoints"]["axis0.current_state"]["type"]
-
-        # Wait for the calibration process to complete
-        start_time = time.time()
-        timeout = 15  # Allow up to 15 seconds for calibration
-
-        while time.time() - start_time < timeout:
-            # Query the current state
-            state = read_config(bus, node_id, state_endpoint_id, state_endpoint_type)
+    heartbeat_ids = {node_id << 5 | HEARTBEAT: node_id for node_id in node_ids}
+    last_state = dict.fromkeys(node_ids)
+    left_idle = set()
+    done = {}
+
+    deadline = time.monotonic() + timeout
+    while len(done) < len(node_ids):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        msg = bus.recv(timeout=remaining)
+        if msg is None or msg.arbitration_id not in heartbeat_ids or len(msg.data) < HEARTBEAT_STRUCT.size:
+            continue
+
+        node_id = heartbeat_ids[msg.arbitration_id]
+        if node_id in done:
+            continue
+
+        axis_error, state, result = HEARTBEAT_STRUCT.unpack_from(msg.data)
+
+        # Referencing "IDLE" state directly from ODRIVE_STATES; an aborted calibration also drops back to it
+        if state == 1 and node_id in left_idle and result != PROCEDURE_BUSY:
+            if axis_error or result != PROCEDURE_SUCCESS:
+                log.error("Node %s calibration failed: axis_error 0x%X, procedure result %s.",
+                          node_id, axis_error, result)
+                done[node_id] = False
+            else:
+                log.info("Node %s calibration completed successfully.", node_id)
+                done[node_id] = True
+            continue
 
+        if state != 1:
+            left_idle.add(node_id)
+        if state != last_state[node_id]:
             # Map the state to a human-readable description
-            state_description = ODRIVE_STATES.get(state, "UNKNOWN")
+            state_description = ODRIVE_STATES[state] if state < len(ODRIVE_STATES) else "UNKNOWN"
+            log.info("Node %s is in state %s (State Code: %s). Waiting...", node_id, state_description, state)
+            last_state[node_id] = state
 
-            if state == 1:  # Referencing "IDLE" state directly from ODRIVE_STATES
-                print(f"Node {node_id} calibration completed successfully.")
-                return True
-            else:
-                print(f"[INFO] Node {node_id} is in state {state_description} (State Code: {state}). Waiting...")
+    for node_id in node_ids:
+        if node_id not in done:
+            log.error("Node %s did not complete calibration within %s seconds.", node_id, timeout)
+            done[node_id] = False
+    return done
 
-            time.sleep(1)  # Poll every second
+def start_calibration(bus, node_ids):
+    """
+    Sends the full calibration command to every node in node_ids back-to-back.
+    """
+    # Drop any heartbeats queued before the calibration command
+    while bus.recv(timeout=0) is not None:
+        pass
 
-        print(f"[ERROR] Node {node_id} did not complete calibration within {timeout} seconds.")
-        return False
+    for node_id in node_ids:
+        log.info("Starting calibration for node %s...", node_id)
+        send_can_message(bus, node_id, 0x07, '<I', 3)  # Command for full calibration
+
+def calibrate_motor(bus, node_id):
+    """
+    Runs encoder offset calibration for a single motor and waits for it to complete.
+    Completion is detected from the node's heartbeat frames rather than by polling axis0.current_state.
+    """
+    try:
+        start_calibration(bus, [node_id])
+        return wait_for_calibration(bus, [node_id])[node_id]
     except Exception as e:
-        print(f"[ERROR] Calibration error for node {node_id}: {e}")
+        log.error("Calibration error for node %s: %s", node_id, e)
         return False
 
-def safe_calibrate_all_motors():
+def calibrate_all_motors_parallel(bus, node_ids):
+    """
+    Calibrates every node at once, so the total time is that of the slowest motor.
+    Only for rigs where all axes are known to be safe to move together.
+    """
+    try:
+        for node_id in node_ids:
+            set_idle_mode(bus, node_id)  # Ensure node is in IDLE mode
+        start_calibration(bus, node_ids)
+        return wait_for_calibration(bus, node_ids)
+    except Exception as e:
+        log.error("Parallel calibration error: %s", e)
+        return dict.fromkeys(node_ids, False)
+
+def safe_calibrate_all_motors(parallel=False):
     """
     Safely calibrates all motors on the CAN network.
     """
+    bus = None
     try:
-        bus = can.interface.Bus("can0", bustype="socketcan")
-        print("Discovering ODrives on the CAN network...")
+        bus = get_bus()
+        log.info("Discovering ODrives on the CAN network...")
         node_ids = discover_node_ids(bus)
-        print(f"Discovered {len(node_ids)} ODrive(s) on the network:\n")
+        log.info("Discovered %s ODrive(s) on the network:\n", len(node_ids))
 
-        # Load endpoints for calibration
-        endpoints = load_endpoints()
+        if parallel:
+            input("Ensure it is safe to calibrate ALL nodes at once. Press Enter to continue...")
+            results = calibrate_all_motors_parallel(bus, node_ids)
+            for node_id, ok in results.items():
+                if not ok:
+                    log.error("Calibration failed for node %s.", node_id)
+            log.info("Calibration process completed.")
+            return
 
         for node_id in node_ids:
-            print(f"Preparing to calibrate node {node_id}.")
+            log.info("Preparing to calibrate node %s.", node_id)
             input("Ensure it is safe to proceed with calibration. Press Enter to continue...")
 
             set_idle_mode(bus, node_id)  # Ensure node is in IDLE mode
-            if calibrate_motor(bus, node_id, endpoints):  # Pass endpoints to calibrate_motor
-                print(f"Node {node_id} successfully calibrated.\n")
+            if calibrate_motor(bus, node_id):
+                log.info("Node %s successfully calibrated.\n", node_id)
             else:
-                print(f"[ERROR] Calibration failed for node {node_id}. Moving to the next node.\n")
+                log.error("Calibration failed for node %s. Moving to the next node.\n", node_id)
 
-        print("Calibration process completed.")
+        log.info("Calibration process completed.")
     except Exception as e:
-        print(f"[ERROR] Calibration process encountered an error: {e}")
+        log.error("Calibration process encountered an error: %s", e)
     finally:
-        if 'bus' in locals() or 'bus' in globals():
-            bus.shutdown()
+        if bus is not None:
+            shutdown_bus()
 
 if __name__ == "__main__":
-    safe_calibrate_all_motors()
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description='ODrive Calibrator.')
+    parser.add_argument('--parallel', action='store_true', help='Calibrate all nodes at once instead of one at a time.')
+    args = parser.parse_args()
+    safe_calibrate_all_motors(parallel=args.parallel)
\ No newline at end of file
@@ -4,8 +4,8 @@ import argparse
 import json
 import can
 import sys
-from src.can_utils import discover_node_ids
-from src.configure import load_endpoints, clear_errors
+from src.can_utils import discover_node_ids, get_bus, shutdown_bus
+from src.configure import load_endpoints, index_endpoints, clear_errors
 
 def main():
     # Argument parser to handle flags
@@ -13,23 +13,24 @@ def main():
     parser.add_argument('-read', action='store_true', help='Only read the errors without clearing them.')
     args = parser.parse_args()
 
+    bus = None
     try:
         # Initialize CAN bus
-        bus = can.interface.Bus("can0", bustype="socketcan")
+        bus = get_bus()
 
         # Discover ODrive nodes on the network
         node_ids = discover_node_ids(bus)
 
         # Load configuration and endpoint data
-        endpoints = load_endpoints()
+        endpoint_index = index_endpoints(load_endpoints())
 
         # Clear or read errors for each discovered ODrive node
         for node_id in node_ids:
             print(f"Processing node {node_id}")
             if args.read:
-                clear_errors(bus, node_id, endpoints, clear=False)  # Read only
+                clear_errors(bus, node_id, endpoint_index, clear=False)  # Read only
             else:
-                clear_errors(bus, node_id, endpoints, clear=True)   # Read and clear
+                clear_errors(bus, node_id, endpoint_index, clear=True)   # Clear active errors without reading them; disarm reason is still read
 
     except (can.CanError, OSError, FileNotFoundError, json.JSONDecodeError) as e:
         print(f"Initialization error: {e}")
@@ -37,8 +38,8 @@ def main():
 
     finally:
         # Shutdown the CAN bus on script exit
-        if 'bus' in locals() or 'bus' in globals():
-            bus.shutdown()
+        if bus is not None:
+            shutdown_bus()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
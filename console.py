@@ -1,14 +1,16 @@
 #!/usr/bin/env python3
 
-import time
-import can
+import asyncio
 import urwid
 import signal
-from threading import Thread
-from src.can_utils import discover_node_ids
-from src.control import move_odrive_to_position, set_closed_loop_control, set_idle_mode
-from src.metrics import get_metrics, METRIC_ENDPOINTS
-from src.configure import load_endpoints
+try:
+    import uvloop  # Optional; a faster drop-in event loop for the CAN watch and alarms
+except ImportError:
+    uvloop = None
+from src.can_utils import discover_node_ids, send_can_messages, get_bus, shutdown_bus
+from src.control import wait_until_settled, make_position_message, set_position_message, move_odrives_to_positions, set_closed_loop_controls, set_idle_modes
+from src.metrics import MetricsCache, METRICS_HEADER
+from src.configure import load_endpoints, index_endpoints
 
 
 class ShoulderController:
@@ -21,14 +23,14 @@ class ShoulderController:
         self.node_id_pair = node_id_pair   # e.g. [1, 2]
         self.endpoints = endpoints
         self.shoulder_val = 0.0
+        self._messages = [make_position_message(nd) for nd in node_id_pair]
 
     def apply_shoulder_values(self):
-        nodeA, nodeB = self.node_id_pair
+        msgA, msgB = self._messages
         motorA_target = -self.shoulder_val
         motorB_target = self.shoulder_val
 
-        move_odrive_to_position(self.bus, nodeA, motorA_target)
-        move_odrive_to_position(self.bus, nodeB, motorB_target)
+        send_can_messages(self.bus, (set_position_message(msgA, motorA_target), set_position_message(msgB, motorB_target)))
 
 
 class ForearmController:
@@ -42,14 +44,14 @@ class ForearmController:
         self.endpoints = endpoints
         self.unison_val = 0.0
         self.diff_val = 0.0
+        self._messages = [make_position_message(nd) for nd in node_id_pair]
 
     def apply_forearm_values(self):
-        nodeA, nodeB = self.node_id_pair
+        msgA, msgB = self._messages
         motorA_target = self.unison_val + self.diff_val
         motorB_target = self.unison_val - self.diff_val
 
-        move_odrive_to_position(self.bus, nodeA, motorA_target)
-        move_odrive_to_position(self.bus, nodeB, motorB_target)
+        send_can_messages(self.bus, (set_position_message(msgA, motorA_target), set_position_message(msgB, motorB_target)))
 
 
 class ODriveSlider(urwid.WidgetWrap):
@@ -68,23 +70,29 @@ class ODriveSlider(urwid.WidgetWrap):
         self.min_val = min_val
         self.max_val = max_val
         self.value = 0.0
+        self.pending = False  # Set when value changed but has not been sent yet
 
         self.shared_forearm = shared_forearm
         self.forearm_mode = forearm_mode  # 'unison', 'diff', or None
 
         self.shared_shoulder = shared_shoulder  # If not None => shoulder joint
 
-        # Decide a label based on the mode
+        # Decide the label format and motor strategy once based on the mode
         if self.shared_shoulder:
-            label_text = f"Shoulder (Nodes {node_ids[0]}, {node_ids[1]}): {self.value:.1f}"
+            self._label_fmt = f"Shoulder (Nodes {node_ids[0]}, {node_ids[1]}): {{:.1f}}"
+            self._apply = self._apply_shoulder
         elif self.shared_forearm and self.forearm_mode == 'unison':
-            label_text = f"Forearm UNISON: {self.value:.1f}"
+            self._label_fmt = "Forearm UNISON: {:.1f}"
+            self._apply = self._apply_forearm_unison
         elif self.shared_forearm and self.forearm_mode == 'diff':
-            label_text = f"Forearm DIFF: {self.value:.1f}"
+            self._label_fmt = "Forearm DIFF: {:.1f}"
+            self._apply = self._apply_forearm_diff
         else:
-            label_text = f"ODrive {', '.join(map(str, self.node_ids))}: {self.value:.1f}"
+            self._label_fmt = f"ODrive {', '.join(map(str, self.node_ids))}: {{:.1f}}"
+            self._apply = self._apply_plain
+            self._messages = [make_position_message(nd) for nd in node_ids]
 
-        self.label = urwid.Text(label_text)
+        self.label = urwid.Text(self._label_fmt.format(self.value))
         self.pile = urwid.Pile([self.label])
         super().__init__(urwid.AttrMap(self.pile, None, focus_map='reversed'))
 
@@ -92,53 +100,65 @@ class ODriveSlider(urwid.WidgetWrap):
         self.value = max(self.min_val, min(self.max_val, self.value + increment))
 
         # Update label
-        if self.shared_shoulder:
-            self.label.set_text(f"Shoulder (Nodes {self.node_ids[0]}, {self.node_ids[1]}): {self.value:.1f}")
-        elif self.shared_forearm and self.forearm_mode == 'unison':
-            self.label.set_text(f"Forearm UNISON: {self.value:.1f}")
-        elif self.shared_forearm and self.forearm_mode == 'diff':
-            self.label.set_text(f"Forearm DIFF: {self.value:.1f}")
-        else:
-            self.label.set_text(f"ODrive {', '.join(map(str, self.node_ids))}: {self.value:.1f}")
+        self.label.set_text(self._label_fmt.format(self.value))
 
-        self.move_motor()
+        # Sent on the next flush_pending_moves tick rather than on every keystroke
+        self.pending = True
 
     def move_motor(self):
-        # If forearm, set unison/diff
-        if self.shared_forearm and self.forearm_mode in ['unison', 'diff']:
-            if self.forearm_mode == 'unison':
-                self.shared_forearm.unison_val = self.value
-            else:
-                self.shared_forearm.diff_val = self.value
-            self.shared_forearm.apply_forearm_values()
-
-        # If shoulder, set the single "shoulder_val"
-        elif self.shared_shoulder:
-            self.shared_shoulder.shoulder_val = self.value
-            self.shared_shoulder.apply_shoulder_values()
+        self._apply()
 
-        else:
-            # Single or normal pair
-            for node_id in self.node_ids:
-                move_odrive_to_position(self.bus, node_id, self.value)
+    def _apply_forearm_unison(self):
+        self.shared_forearm.unison_val = self.value
+        self.shared_forearm.apply_forearm_values()
+
+    def _apply_forearm_diff(self):
+        self.shared_forearm.diff_val = self.value
+        self.shared_forearm.apply_forearm_values()
+
+    def _apply_shoulder(self):
+        # Shoulder uses the single "shoulder_val"
+        self.shared_shoulder.shoulder_val = self.value
+        self.shared_shoulder.apply_shoulder_values()
 
+    def _apply_plain(self):
+        # Single or normal pair, every node's frame in one burst
+        send_can_messages(self.bus, [set_position_message(msg, self.value) for msg in self._messages])
+
+
+def flush_pending_moves(loop, sliders, interval=0.02):
+    """
+    Sends the latest value of every slider changed since the last tick.
+    Holding a key then costs at most one CAN frame per motor every interval seconds.
+    """
+    for slider in sliders:
+        if slider.pending:
+            slider.pending = False
+            slider.move_motor()
+    loop.set_alarm_in(interval, flush_pending_moves, sliders)
 
 def clean_shutdown(node_ids, bus):
     print("\nExiting... resetting ODrives to position 0 and setting them to idle.")
-    for nd in node_ids:
-        move_odrive_to_position(bus, nd, 0)
-    time.sleep(2)
-    for nd in node_ids:
-        set_idle_mode(bus, nd)
+    move_odrives_to_positions(bus, [(nd, 0.0) for nd in node_ids])
+    wait_until_settled(bus, node_ids)
+    set_idle_modes(bus, node_ids)
     if bus:
-        bus.shutdown()
+        shutdown_bus()
 
 def signal_handler(sig, frame):
     raise KeyboardInterrupt
 
-def handle_input(key, columns, sliders, node_ids, bus):
+def build_focus_moves(count):
+    """
+    Precomputes the focus index reached from each slider by 'left' and 'right', clamped at the ends.
+    """
+    return {
+        'left':  [max(i - 1, 0) for i in range(count)],
+        'right': [min(i + 1, count - 1) for i in range(count)],
+    }
+
+def handle_input(key, columns, sliders, focus_moves):
     if key == 'esc':
-        clean_shutdown(node_ids, bus)
         raise urwid.ExitMainLoop()
     elif key in ('up', 'down'):
         # Adjust the slider value
@@ -146,49 +166,34 @@ def handle_input(key, columns, sliders, node_ids, bus):
         slider = sliders[focus]
         increment = 0.1 if key == 'up' else -0.1
         slider.update_value(increment)
-    elif key in ('left', 'right'):
-        focus = columns.focus_position
-        if key == 'right' and focus < len(sliders) - 1:
-            columns.focus_position += 1
-        elif key == 'left' and focus > 0:
-            columns.focus_position -= 1
-
-def update_metrics_textbox(bus, node_ids, endpoints, metrics_text, loop):
-    column_widths = {
-        metric: max(len(metric), 4) + 3
-        for metric in METRIC_ENDPOINTS.keys()
-    }
-    node_col_width = 6
-
-    # Build the header line
-    header = f"{'Node':<{node_col_width}}" + "".join(
-        f"{name:<{column_widths[name]}}" for name in METRIC_ENDPOINTS.keys()
-    )
+    elif key in focus_moves:
+        columns.focus_position = focus_moves[key][columns.focus_position]
 
-    while True:
-        lines = [header]
-        for nd in node_ids:
-            metrics = get_metrics(bus, nd, endpoints)
-            line = f"{nd:<{node_col_width}}"
-            for metric, val in metrics.items():
-                if isinstance(val, (float,int)):
-                    sign_space = ' ' if val >= 0 else ''
-                    formatted_val = f"{sign_space}{val:.2f}"
-                    line += f"{formatted_val:<{column_widths[metric]}}"
-                else:
-                    # If None or non-numeric => show "None"
-                    line += f"{'None':<{column_widths[metric]}}"
-            lines.append(line)
-
-        metrics_text.set_text("\n".join(lines))
-        time.sleep(0.1)
-        loop.draw_screen()
+class MetricsMonitor(MetricsCache):
+    """
+    Keeps the metrics table up to date without a polling thread.
+    Reads are fired from a urwid alarm on the main loop, and replies are
+    decoded when the bus socket becomes readable into the cache that the next
+    alarm renders from. The table is a Pile of one Text per node, in widget.
+    """
+    def __init__(self, bus, node_ids, endpoint_index, refresh_interval=0.1):
+        super().__init__(bus, node_ids, endpoint_index)
+        self.refresh_interval = refresh_interval
+        self.rows = [urwid.Text("Fetching metrics...", align='left') for _ in node_ids]
+        self.widget = urwid.Pile([urwid.Text(METRICS_HEADER, align='left')] + self.rows)
+
+    def refresh(self, loop, user_data=None):
+        self.update_rows(self.rows)
+        # Fire the next round of reads; replies arrive via on_message
+        self.request()
+        loop.set_alarm_in(self.refresh_interval, self.refresh)
 
 def main():
     signal.signal(signal.SIGINT, signal_handler)
-    bus = can.interface.Bus("can0", bustype="socketcan")
+    bus = get_bus()
     node_ids = list(discover_node_ids(bus))
     endpoints = load_endpoints()
+    endpoint_index = index_endpoints(endpoints)
 
     if not node_ids:
         print("No ODrives detected on the CAN network. Exiting.")
@@ -197,12 +202,16 @@ def main():
     node_ids.sort()
     print(f"Detected ODrive Node IDs: {node_ids}")
 
-    # Set each discovered node to CLOSED_LOOP_CONTROL
-    for nd in node_ids:
-        if not set_closed_loop_control(bus, nd):
-            print(f"[ERROR] Could not set node {nd} to CLOSED_LOOP_CONTROL. Exiting.")
-            bus.shutdown()
-            return
+    # Arrow keys arrive as escape sequences; don't hold them back waiting for more bytes.
+    # Built before the motors are armed, so a failure here can't leave them in closed loop
+    screen = urwid.raw_display.Screen()
+    screen.set_input_timeouts(complete_wait=0.01)
+
+    # Set every discovered node to CLOSED_LOOP_CONTROL in one burst
+    if not set_closed_loop_controls(bus, node_ids):
+        print(f"[ERROR] Could not set nodes {node_ids} to CLOSED_LOOP_CONTROL. Exiting.")
+        shutdown_bus()
+        return
 
     # Build your sliders logic
     sliders = []
@@ -258,8 +267,10 @@ def main():
         sliders.append(slider_diff)
 
     columns = urwid.Columns([urwid.LineBox(s) for s in sliders])
-    metrics_text = urwid.Text("Fetching metrics...", align='left')
-    pile = urwid.Pile([columns, metrics_text])
+    focus_moves = build_focus_moves(len(sliders))
+    # Metrics are requested from an alarm and decoded as CAN frames arrive, all on one event loop
+    monitor = MetricsMonitor(bus, node_ids, endpoint_index)
+    pile = urwid.Pile([columns, monitor.widget])
     frame = urwid.Frame(
         urwid.Filler(pile, valign='top'),
         footer=urwid.Text("Press ESC to exit", align='center')
@@ -268,23 +279,23 @@ def main():
     loop = urwid.MainLoop(
         frame,
         palette=[('reversed', 'standout', '')],
-        unhandled_input=lambda k: handle_input(k, columns, sliders, node_ids, bus)
+        screen=screen,
+        handle_mouse=False,
+        unhandled_input=lambda k: handle_input(k, columns, sliders, focus_moves),
+        event_loop=urwid.AsyncioEventLoop(loop=uvloop.new_event_loop() if uvloop else asyncio.new_event_loop())
     )
 
-    # Start metrics update thread
-    Thread(
-        target=update_metrics_textbox,
-        args=(bus, node_ids, endpoints, metrics_text, loop),
-        daemon=True
-    ).start()
+    can_watch = loop.watch_file(bus.fileno(), monitor.on_readable)
+    loop.set_alarm_in(0, monitor.refresh)
+    loop.set_alarm_in(0, flush_pending_moves, sliders)
 
     try:
         loop.run()
     except KeyboardInterrupt:
-        clean_shutdown(node_ids, bus)
+        pass
     finally:
-        if bus:
-            bus.shutdown()
+        loop.remove_watch_file(can_watch)
+        clean_shutdown(node_ids, bus)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,16 +1,22 @@
 #!/usr/bin/env python3
 
+import asyncio
 import time
-import threading
 import signal
 import urwid
 import pygame
-import can
-
-from src.can_utils import discover_node_ids
-from src.control import move_odrive_to_position, set_closed_loop_control, set_idle_mode
-from src.metrics import get_metrics, METRIC_ENDPOINTS
-from src.configure import load_endpoints
+try:
+    import uvloop  # Optional; a faster drop-in event loop for the CAN watch and the tick tasks
+except ImportError:
+    uvloop = None
+
+from src.can_utils import discover_node_ids, get_bus, send_can_messages, shutdown_bus
+from src.control import (
+    wait_until_settled, move_odrives_to_positions,
+    make_position_message, set_position_message, set_closed_loop_controls, set_idle_modes
+)
+from src.metrics import MetricsCache, METRICS_HEADER
+from src.configure import load_endpoints, index_endpoints
 
 # ------------------------------
 # 1) Button and axis definitions
@@ -43,7 +49,15 @@ JOINT3_MIN, JOINT3_MAX =  -6,    0  # node4
 FOREARM_UNISON_MIN, FOREARM_UNISON_MAX = -25, 25
 FOREARM_DIFF_MIN,   FOREARM_DIFF_MAX   = -25, 25
 
-stop_event = threading.Event()
+# Single-motor joints => (node_id, joint_positions index, axis, sign, min, max)
+# The left stick joints only move outside forearm mode
+RIGHT_STICK_JOINTS = (
+    (3, 2, AXIS_RIGHT_X,  1.0, JOINT2_MIN, JOINT2_MAX),
+    (4, 3, AXIS_RIGHT_Y, -1.0, JOINT3_MIN, JOINT3_MAX),
+)
+LEFT_STICK_JOINTS = (
+    (0, 0, AXIS_LEFT_X,   1.0, JOINT0_MIN, JOINT0_MAX),
+)
 
 # We'll store joystick states for UI
 joystick_states = {
@@ -51,35 +65,49 @@ joystick_states = {
     "axes": {AXIS_LEFT_X:0.0, AXIS_LEFT_Y:0.0, AXIS_RIGHT_X:0.0, AXIS_RIGHT_Y:0.0}
 }
 
+# Raw controller state, updated from pygame joystick events rather than polled
+cached_axes    = [0.0]*6
+cached_buttons = [0]*16
+
+# Last position sent to each node while LB is held, so unchanged setpoints are skipped
+last_sent = {}
+
+# One reusable Set_Input_Position frame per discovered node, filled in place each tick
+position_messages = {}
+
 # ------------------------------
 # 3) Helper functions
 # ------------------------------
-def apply_dead_zone(value):
-    return 0.0 if abs(value) < DEAD_ZONE else value
+def clamp(value, low, high):
+    return min(max(value, low), high)
+
+def step_joints(joints, axes, node_ids, joint_positions, step, updates):
+    """
+    Integrates each discovered joint by its axis over one tick, clamps it and queues the setpoint.
+    """
+    for nid, idx, axis, sign, low, high in joints:
+        if nid in node_ids:
+            pos = min(max(joint_positions[idx] + sign*axes[axis]*step, low), high)
+            joint_positions[idx] = pos
+            updates.append((nid, pos))
 
 def signal_handler(sig, frame):
     raise KeyboardInterrupt
 
 def handle_input(key, loop, node_ids, bus, joint_positions):
     if key == 'esc':
-        stop_event.set()
         raise urwid.ExitMainLoop()
 
 def clean_shutdown(node_ids, bus, joint_positions):
     print("\nExiting... setting discovered ODrives to pos=0 => IDLE => shutdown.")
-    for nid in node_ids:
-        try:
-            move_odrive_to_position(bus, nid, 0)
-        except Exception as e:
-            print(f"[WARN] Could not move node {nid} to 0: {e}")
-    time.sleep(2)
-    for nid in node_ids:
-        try:
-            set_idle_mode(bus, nid)
-        except Exception as e:
-            print(f"[WARN] Could not set node {nid} to IDLE: {e}")
+    # Each step goes out to every node in one burst, then waits once for all of them
+    if not move_odrives_to_positions(bus, [(nid, 0.0) for nid in node_ids]):
+        print(f"[WARN] Could not move nodes {node_ids} to 0")
+    wait_until_settled(bus, node_ids)
+    if not set_idle_modes(bus, node_ids):
+        print(f"[WARN] Could not set nodes {node_ids} to IDLE")
     if bus:
-        bus.shutdown()
+        shutdown_bus()
 
 # ------------------------------
 # 4) Shoulder & Forearm classes
@@ -95,13 +123,12 @@ class ShoulderController:
         self.node_ids  = node_ids  # [1,2]
         self.value     = 0.0
 
-    def apply(self):
+    def setpoints(self):
         nA, nB = self.node_ids
         # If you want to clamp more strictly, do it here or in the thread
         motorA = self.value
         motorB = -self.value
-        move_odrive_to_position(self.bus, nA, motorA)
-        move_odrive_to_position(self.bus, nB, motorB)
+        return [(nA, motorA), (nB, motorB)]
 
 class ForearmController:
     """
@@ -116,146 +143,162 @@ class ForearmController:
         self.unison_val = 0.0
         self.diff_val   = 0.0
 
-    def apply(self):
+    def setpoints(self):
         # clamp
-        if self.unison_val < FOREARM_UNISON_MIN: self.unison_val = FOREARM_UNISON_MIN
-        if self.unison_val > FOREARM_UNISON_MAX: self.unison_val = FOREARM_UNISON_MAX
-        if self.diff_val   < FOREARM_DIFF_MIN:   self.diff_val   = FOREARM_DIFF_MIN
-        if self.diff_val   > FOREARM_DIFF_MAX:   self.diff_val   = FOREARM_DIFF_MAX
+        self.unison_val = clamp(self.unison_val, FOREARM_UNISON_MIN, FOREARM_UNISON_MAX)
+        self.diff_val   = clamp(self.diff_val,   FOREARM_DIFF_MIN,   FOREARM_DIFF_MAX)
 
         nA, nB = self.node_ids
         motorA = self.unison_val + self.diff_val
         motorB = self.unison_val - self.diff_val
-        move_odrive_to_position(self.bus, nA, motorA)
-        move_odrive_to_position(self.bus, nB, motorB)
+        return [(nA, motorA), (nB, motorB)]
 
 # ------------------------------
-# 5) UI update thread
+# 5) UI update task
 # ------------------------------
-def update_ui_thread(bus, node_ids, endpoints, metrics_text, joystick_text, loop):
-    # Build widths
-    col_widths = {}
-    for metric in METRIC_ENDPOINTS:
-        col_widths[metric] = max(len(metric),4)+3
-
-    node_col_w = 6
-    header = f"{'Node':<{node_col_w}}" + "".join(
-        f"{m:<{col_widths[m]}}" for m in METRIC_ENDPOINTS
-    )
-
-    axis_names = ["LeftX","LeftY","RightX","RightY"]
-    axis_col_w = max(len(x) for x in axis_names) + 3
-    joy_header_line = "LB".ljust(8) + "".join(x.ljust(axis_col_w) for x in axis_names)
-
-    while not stop_event.is_set():
-        # ODrive metrics
-        lines = [header]
-        for nid in node_ids:
-            data = get_metrics(bus, nid, endpoints)
-            row = f"{nid:<{node_col_w}}"
-            for metric in METRIC_ENDPOINTS:
-                val = data.get(metric, None)
-                if isinstance(val, (int,float)):
-                    sign_space= ' ' if val>=0 else ''
-                    row+= f"{sign_space}{val:.2f}".ljust(col_widths[metric])
-                else:
-                    row+= f"{'None':<{col_widths[metric]}}"
-            lines.append(row)
-        metrics_text.set_text("\n".join(lines))
-
-        # Joystick line
+# Joystick line layout and %-template, built once rather than on every redraw
+AXIS_NAMES = ("LeftX","LeftY","RightX","RightY")
+AXIS_ORDER = (AXIS_LEFT_X, AXIS_LEFT_Y, AXIS_RIGHT_X, AXIS_RIGHT_Y)
+AXIS_COL_WIDTH = max(len(x) for x in AXIS_NAMES) + 3
+JOY_HEADER = "LB".ljust(8) + "".join(x.ljust(AXIS_COL_WIDTH) for x in AXIS_NAMES)
+JOY_LINE_FORMAT = "%-8s" + ("%6.2f" + " " * (AXIS_COL_WIDTH - 6)) * len(AXIS_ORDER)
+
+async def ui_loop(metrics, metrics_rows, joystick_text, loop, interval=0.1, metrics_interval=0.5):
+    axes = joystick_states["axes"]
+    last_joy = None
+    next_metrics = time.monotonic()
+
+    while True:
+        dirty = False
+
+        # ODrive metrics, from whatever has arrived since the last refresh
+        now = time.monotonic()
+        if now >= next_metrics:
+            next_metrics = now + metrics_interval
+            # One Text per node; only rows whose text changed are laid out and repainted
+            if metrics.update_rows(metrics_rows):
+                dirty = True
+            metrics.request()
+
+        # Joystick line, only touched when its rounded values change
         lb_str = "Pressed" if joystick_states["LB"] else "NotPress"
-        joy_line = lb_str.ljust(8)
-        for idx in (AXIS_LEFT_X, AXIS_LEFT_Y, AXIS_RIGHT_X, AXIS_RIGHT_Y):
-            v = joystick_states["axes"].get(idx, 0.0)
-            joy_line += f"{v:>6.2f}".ljust(axis_col_w)
-
-        joystick_text.set_text(joy_header_line + "\n" + joy_line)
-
-        time.sleep(0.1)
-        try:
+        joy_line = JOY_LINE_FORMAT % ((lb_str,) + tuple(axes[idx] for idx in AXIS_ORDER))
+        if joy_line != last_joy:
+            last_joy = joy_line
+            joystick_text.set_text(JOY_HEADER + "\n" + joy_line)
+            dirty = True
+
+        # Tasks outside urwid's own callbacks must request the redraw themselves
+        if dirty:
             loop.draw_screen()
-        except (urwid.ExitMainLoop, RuntimeError):
-            break
+        await asyncio.sleep(interval)
 
 # ------------------------------
-# 6) Main joystick logic thread
+# 6) Main joystick logic task
 # ------------------------------
-def joystick_thread_func(bus, node_ids, joint_positions,
-                         shoulder_ctrl, forearm_ctrl,
-                         update_rate=UPDATE_RATE):
-    clock = pygame.time.Clock()
+async def joystick_loop(bus, node_ids, joint_positions,
+                        shoulder_ctrl, forearm_ctrl,
+                        update_rate=UPDATE_RATE):
     js= pygame.joystick.Joystick(0)
     js.init()
-
-    while not stop_event.is_set():
-        dt= clock.tick(update_rate)/1000.0
-        pygame.event.pump()
-
-        lb= js.get_button(DEAD_MAN_BUTTON_INDEX)
-        rb= js.get_button(MODE_TOGGLE_BUTTON_INDEX)
-        joystick_states["LB"] = bool(lb)
-
-        # read left stick
-        lx= apply_dead_zone(js.get_axis(AXIS_LEFT_X))
-        ly= apply_dead_zone(js.get_axis(AXIS_LEFT_Y))
-        # read right stick
-        rx= apply_dead_zone(js.get_axis(AXIS_RIGHT_X))
-        ry= apply_dead_zone(js.get_axis(AXIS_RIGHT_Y))
-
-        # store for UI
-        joystick_states["axes"][AXIS_LEFT_X]  = lx
-        joystick_states["axes"][AXIS_LEFT_Y]  = ly
-        joystick_states["axes"][AXIS_RIGHT_X] = rx
-        joystick_states["axes"][AXIS_RIGHT_Y] = ry
-
-        # Movement only if LB pressed
-        if lb:
-            forearm_mode = (rb==1)
-
-            # Joint 2 => Node 3 => Right Stick X
-            if 3 in node_ids:
-                joint_positions[2]+= rx*VELOCITY_SCALING*dt
-                if joint_positions[2]<JOINT2_MIN: joint_positions[2]=JOINT2_MIN
-                if joint_positions[2]>JOINT2_MAX: joint_positions[2]=JOINT2_MAX
-                move_odrive_to_position(bus, 3, joint_positions[2])
-
-            # Joint 3 => Node 4 => Right Stick Y
-            if 4 in node_ids:
-                joint_positions[3] -= ry*VELOCITY_SCALING*dt
-                if joint_positions[3]<JOINT3_MIN: joint_positions[3]=JOINT3_MIN
-                if joint_positions[3]>JOINT3_MAX: joint_positions[3]=JOINT3_MAX
-                move_odrive_to_position(bus, 4, joint_positions[3])
-
-            if not forearm_mode:
-                # => left stick controls Joint0 & Joint1
-                # Joint0 => Node0 => leftX => joint_positions[0]
-                if 0 in node_ids:
-                    joint_positions[0]+= lx*VELOCITY_SCALING*dt
-                    if joint_positions[0]<JOINT0_MIN: joint_positions[0]=JOINT0_MIN
-                    if joint_positions[0]>JOINT0_MAX: joint_positions[0]=JOINT0_MAX
-                    move_odrive_to_position(bus, 0, joint_positions[0])
-
-                # Joint1 => Node(1,2) => leftY => Shoulder
-                if shoulder_ctrl and (1 in node_ids) and (2 in node_ids):
-                    # We'll clamp if needed (like JOINT1_MIN, JOINT1_MAX)
-                    # but we do so by adjusting 'shoulder_ctrl.value'
-                    new_val = shoulder_ctrl.value + ly*VELOCITY_SCALING*dt
-                    if new_val<JOINT1_MIN: new_val=JOINT1_MIN
-                    if new_val>JOINT1_MAX: new_val=JOINT1_MAX
-                    shoulder_ctrl.value= new_val
-                    shoulder_ctrl.apply()
-            else:
-                # => left stick controls Forearm (diff=lx, unison=ly)
-                if forearm_ctrl and (5 in node_ids) and (6 in node_ids):
-                    forearm_ctrl.diff_val   += (lx*VELOCITY_SCALING*dt)
-                    forearm_ctrl.unison_val += (ly*VELOCITY_SCALING*dt)
-                    forearm_ctrl.apply()
+    # Seed the caches; from here on only events update them
+    for i in range(min(js.get_numaxes(), len(cached_axes))):
+        cached_axes[i]= js.get_axis(i)
+    for i in range(min(js.get_numbuttons(), len(cached_buttons))):
+        cached_buttons[i]= js.get_button(i)
+
+    # Ticks are paced against absolute deadlines so tick time and sleep
+    # overshoot don't accumulate; dt is the measured elapsed time
+    period= 1.0/update_rate
+    last= time.monotonic()
+    deadline= last + period
+    while True:
+        await asyncio.sleep(max(deadline - time.monotonic(), 0.0))
+        now= time.monotonic()
+        deadline+= period
+        if now > deadline:
+            # Overran by a whole period => drop the missed ticks instead of bursting
+            deadline= now + period
+        dt= now-last
+        last= now
+        joystick_tick(js, dt, bus, node_ids, joint_positions, shoulder_ctrl, forearm_ctrl)
+
+def joystick_tick(js, dt, bus, node_ids, joint_positions, shoulder_ctrl, forearm_ctrl):
+    """
+    Reads the controller once and moves the joints for a tick of length dt seconds.
+    Events from any other joystick are ignored.
+    """
+    # Hot path => bind globals and attributes to locals once per tick
+    raw_axes, buttons = cached_axes, cached_buttons
+    n_axes, n_buttons = len(raw_axes), len(buttons)
+    JOYAXISMOTION, JOYBUTTONDOWN, JOYBUTTONUP = pygame.JOYAXISMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP
+    instance_id = js.get_instance_id()
+    for ev in pygame.event.get():
+        ev_type = ev.type
+        if ev_type == JOYAXISMOTION:
+            if ev.instance_id == instance_id and ev.axis < n_axes:
+                raw_axes[ev.axis]= ev.value
+        elif ev_type == JOYBUTTONDOWN:
+            if ev.instance_id == instance_id and ev.button < n_buttons:
+                buttons[ev.button]= 1
+        elif ev_type == JOYBUTTONUP:
+            if ev.instance_id == instance_id and ev.button < n_buttons:
+                buttons[ev.button]= 0
+
+    lb= buttons[DEAD_MAN_BUTTON_INDEX]
+    rb= buttons[MODE_TOGGLE_BUTTON_INDEX]
+    joystick_states["LB"] = bool(lb)
+
+    # read sticks, dead zone inlined
+    dz = DEAD_ZONE
+    lx = raw_axes[AXIS_LEFT_X];  lx = 0.0 if -dz < lx < dz else lx
+    ly = raw_axes[AXIS_LEFT_Y];  ly = 0.0 if -dz < ly < dz else ly
+    rx = raw_axes[AXIS_RIGHT_X]; rx = 0.0 if -dz < rx < dz else rx
+    ry = raw_axes[AXIS_RIGHT_Y]; ry = 0.0 if -dz < ry < dz else ry
+
+    # store for UI
+    axes = joystick_states["axes"]
+    axes[AXIS_LEFT_X]  = lx
+    axes[AXIS_LEFT_Y]  = ly
+    axes[AXIS_RIGHT_X] = rx
+    axes[AXIS_RIGHT_Y] = ry
+
+    # Movement only if LB pressed
+    if lb:
+        forearm_mode = (rb==1)
+        # Setpoints computed this tick, sent together in one burst at the end
+        updates = []
+
+        step = VELOCITY_SCALING*dt
+
+        # Joint 2 => Node 3 => Right Stick X, Joint 3 => Node 4 => Right Stick Y
+        step_joints(RIGHT_STICK_JOINTS, axes, node_ids, joint_positions, step, updates)
+
+        if not forearm_mode:
+            # => left stick controls Joint0 & Joint1
+            # Joint0 => Node0 => leftX => joint_positions[0]
+            step_joints(LEFT_STICK_JOINTS, axes, node_ids, joint_positions, step, updates)
+
+            # Joint1 => Node(1,2) => leftY => Shoulder
+            if shoulder_ctrl and (1 in node_ids) and (2 in node_ids):
+                # Clamp by adjusting 'shoulder_ctrl.value'
+                shoulder_ctrl.value = clamp(shoulder_ctrl.value + ly*step, JOINT1_MIN, JOINT1_MAX)
+                updates.extend(shoulder_ctrl.setpoints())
         else:
-            pass
-
-        time.sleep(0.01)
-
+            # => left stick controls Forearm (diff=lx, unison=ly)
+            if forearm_ctrl and (5 in node_ids) and (6 in node_ids):
+                forearm_ctrl.diff_val   += lx*step
+                forearm_ctrl.unison_val += ly*step
+                updates.extend(forearm_ctrl.setpoints())
+
+        updates = [(nid, pos) for nid, pos in updates if last_sent.get(nid) != pos]
+        if updates:
+            # A failed burst may have stopped partway; leave last_sent alone so the next tick resends
+            if send_can_messages(bus, [set_position_message(position_messages[nid], pos) for nid, pos in updates]):
+                last_sent.update(updates)
+    else:
+        # Forget what was sent so the first tick after LB is pressed again always sends
+        last_sent.clear()
 
 # ------------------------------
 # 7) Main function
@@ -263,9 +306,9 @@ def joystick_thread_func(bus, node_ids, joint_positions,
 def main():
     signal.signal(signal.SIGINT, signal_handler)
 
-    bus = can.interface.Bus("can0", bustype="socketcan")
+    bus = get_bus()
     discovered= list(discover_node_ids(bus))
-    endpoints= load_endpoints()
+    endpoint_index= index_endpoints(load_endpoints())
 
     if not discovered:
         print("[ERROR] No ODrives found on the CAN bus.")
@@ -274,12 +317,11 @@ def main():
     discovered.sort()
     print(f"Discovered ODrive Node IDs: {discovered}")
 
-    # Set to closed-loop
-    for nid in discovered:
-        if not set_closed_loop_control(bus, nid):
-            print(f"[ERROR] Could not set node {nid} to CLOSED_LOOP_CONTROL.")
-            bus.shutdown()
-            return
+    # Set to closed-loop, all nodes in one burst
+    if not set_closed_loop_controls(bus, discovered):
+        print(f"[ERROR] Could not set nodes {discovered} to CLOSED_LOOP_CONTROL.")
+        shutdown_bus()
+        return
 
     # Init pygame
     pygame.init()
@@ -294,6 +336,8 @@ def main():
     print(f"Joystick: {stick.get_name()}")
     print(f"# Axes: {stick.get_numaxes()}")
 
+    position_messages.update((nid, make_position_message(nid)) for nid in discovered)
+
     max_nid= max(discovered)
     # We'll keep joint_positions for node0 => index0 => joint0, etc
     # node3 => index3 => joint2, node4 => index4 => joint3, etc
@@ -312,48 +356,45 @@ def main():
         print("[INFO] ForearmController for node5,node6 created.")
 
     # Build text UI
-    metrics_text= urwid.Text("Metrics...",align='left')
+    metrics_rows= [urwid.Text("Metrics...",align='left') for _ in discovered]
     joystick_text= urwid.Text("",align='left')
-    box_metrics= urwid.LineBox(metrics_text, title="ODrive Metrics")
+    box_metrics= urwid.LineBox(urwid.Pile([urwid.Text(METRICS_HEADER,align='left')] + metrics_rows), title="ODrive Metrics")
     box_joy= urwid.LineBox(joystick_text, title="Controller Inputs")
 
     pile= urwid.Pile([box_metrics, box_joy])
     foot= urwid.Text("Press ESC to exit", align='center')
     frame= urwid.Frame(pile, footer=foot)
 
+    aloop= uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+    asyncio.set_event_loop(aloop)
     loop= urwid.MainLoop(
         frame,
         palette=[('reversed','standout','')],
-        unhandled_input=lambda k: handle_input(k, loop, discovered, bus, joint_positions)
+        unhandled_input=lambda k: handle_input(k, loop, discovered, bus, joint_positions),
+        event_loop=urwid.AsyncioEventLoop(loop=aloop)
     )
 
-    ui_thread= threading.Thread(
-        target=update_ui_thread,
-        args=(bus, discovered, endpoints, metrics_text, joystick_text, loop),
-        daemon=True
-    )
-    ui_thread.start()
-
-    joy_thread= threading.Thread(
-        target=joystick_thread_func,
-        args=(bus, discovered, joint_positions, shoulder_ctrl, forearm_ctrl),
-        daemon=True
-    )
-    joy_thread.start()
+    metrics= MetricsCache(bus, discovered, endpoint_index)
+    can_watch= loop.watch_file(bus.fileno(), metrics.on_readable)
+    tasks= [
+        aloop.create_task(ui_loop(metrics, metrics_rows, joystick_text, loop)),
+        aloop.create_task(joystick_loop(bus, discovered, joint_positions, shoulder_ctrl, forearm_ctrl)),
+    ]
 
     try:
         loop.run()
     except KeyboardInterrupt:
         pass
     finally:
-        print("[INFO] Main loop ended => stopping threads.")
-        stop_event.set()
-        ui_thread.join()
-        joy_thread.join()
-        print("[INFO] Threads joined => final shutdown.")
+        print("[INFO] Main loop ended => stopping tasks.")
+        for task in tasks:
+            task.cancel()
+        aloop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.remove_watch_file(can_watch)
+        aloop.close()
+        print("[INFO] Tasks stopped => final shutdown.")
         clean_shutdown(discovered, bus, joint_positions)
         pygame.quit()
 
-
 if __name__=="__main__":
     main()
\ No newline at end of file
@@ -1,30 +1,62 @@
 #!/usr/bin/env python3
 
+import argparse
 import can
-from src.can_utils import discover_node_ids
+from concurrent.futures import ThreadPoolExecutor
+from src.can_utils import discover_node_ids, get_bus, open_bus, shutdown_bus, TX_BURST_LIMIT
 from src.configure import *
 
-def main():
+def load_setup_data():
+    return load_configuration(), index_endpoints(load_endpoints())
+
+def configure_node_on_own_bus(node_id, motor_type, config_settings, endpoint_index, skip_read=False, burst_limit=TX_BURST_LIMIT):
+    # A private bus sees every reply itself, so concurrent nodes never drop each other's SDO frames
+    print(f"Configuring node {node_id} with motor type {motor_type}")
+    node_bus = open_bus()
+    try:
+        return setup_odrive(node_bus, node_id, config_settings, endpoint_index, skip_read=skip_read, burst_limit=burst_limit)
+    finally:
+        node_bus.shutdown()
+
+def main(parallel=False, fresh=False):
     bus = None
     try:
-        bus = can.interface.Bus("can0", bustype="socketcan")
-        node_ids = discover_node_ids(bus)
+        bus = get_bus()
 
-        # Load configuration and endpoints
-        config_data = load_configuration()
-        endpoints = load_endpoints()
+        # Load configuration and endpoints while discovery listens for heartbeats
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            loading = executor.submit(load_setup_data)
+            node_ids = discover_node_ids(bus)
+            config_data, endpoint_index = loading.result()
 
-        # Iterate through each node and assign motor settings dynamically
+        # Determine every node's motor type up front, using pole pairs, and skip unknown ones
+        plan = []
         for node_id in node_ids:
-            # Determine motor type using pole pairs
-            motor_type = get_motor_type(bus, node_id, endpoints)
+            motor_type = get_motor_type(bus, node_id, endpoint_index)
+            if motor_type not in config_data:
+                print(f"[WARNING] Skipping node {node_id}: no configuration for motor type {motor_type}")
+                continue
+            plan.append((node_id, motor_type, config_data[motor_type]["settings"]))
+
+        if parallel and plan:
+            # Every worker's socket feeds the same interface TX queue, so they share one burst budget
+            workers = min(len(plan), TX_BURST_LIMIT)
+            burst_limit = TX_BURST_LIMIT // workers
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(
+                    lambda step: configure_node_on_own_bus(*step, endpoint_index, fresh, burst_limit), plan
+                ))
+            for (node_id, _, _), ok in zip(plan, results):
+                if not ok:
+                    print(f"[ERROR] Configuring node {node_id} failed.")
+            return
 
+        for node_id, motor_type, config_settings in plan:
             # Log which node is being configured and its motor type
             print(f"Configuring node {node_id} with motor type {motor_type}")
 
             # Apply configuration settings for the detected motor type
-            config_settings = config_data[motor_type]["settings"]
-            if not setup_odrive(bus, node_id, config_settings, endpoints):
+            if not setup_odrive(bus, node_id, config_settings, endpoint_index, skip_read=fresh):
                 print("Exiting due to an error in configuring a node.")
                 return
 
@@ -36,7 +68,11 @@ def main():
 
     finally:
         if bus is not None:
-            bus.shutdown()
+            shutdown_bus()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='ODrive Setup.')
+    parser.add_argument('--parallel', action='store_true', help='Configure all nodes at once, each over its own CAN socket.')
+    parser.add_argument('--fresh', action='store_true', help='Write every setting without reading current values first, for newly flashed ODrives.')
+    args = parser.parse_args()
+    main(parallel=args.parallel, fresh=args.fresh)
\ No newline at end of file
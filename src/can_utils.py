@@ -1,60 +1,255 @@
+import json
+import os
+import socket
 import struct
 import time
+from contextlib import contextmanager
+from functools import lru_cache
 import can
 
+HEARTBEAT = 0x01  # Cyclic Heartbeat command id, sent by every ODrive node
+
+SOCKET_BUFFER_SIZE = 1 << 20  # Room for bursts of SDO replies without dropping frames
+SOCKET_PRIORITY = 6  # Highest SO_PRIORITY settable without CAP_NET_ADMIN; frames leave ahead of other queued traffic
+# Linux CAN devices default to txqueuelen 10, and a send into a full queue fails with ENOBUFS.
+# A lone request burst keeps at most TX_BURST_LIMIT frames queued; senders sharing the queue
+# with setpoint bursts, like MetricsCache, keep fewer
+TX_QUEUE_LENGTH = 10
+TX_BURST_LIMIT = 8
+
+# Last discovered node set, shared between separate tool invocations
+NODE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "odrive_can_tools", "nodes.json")
+NODE_CACHE_MAX_AGE = 60  # seconds
+NODE_RESCAN_ENV = "ODRIVE_RESCAN"  # Set to 1 to ignore the saved node set, e.g. after adding a node
+NODE_COUNT_ENV = "ODRIVE_NODE_COUNT"  # Set to the number of ODrives on the bus to end discovery once all are heard
+
+# Process-wide bus and discovery results, shared by every tool that imports this module
+_bus = None
+_discovery_cache = {}
+_message_cache = {}  # (node_id, command_id) -> reusable can.Message for send_can_message
+
+def open_bus(channel="can0", bustype="socketcan", socket_priority=SOCKET_PRIORITY, **kwargs):
+    """
+    Opens a new, unshared CAN bus; the caller owns it and must shut it down.
+    Separate buses each see every frame, so workers on their own bus can't consume each other's replies.
+    socket_priority is the SocketCAN SO_PRIORITY; values above 6 need CAP_NET_ADMIN,
+    and SOCKET_PRIORITY is used instead when one is refused.
+    Extra keyword arguments (e.g. host and port for socketcand) go to the python-can interface.
+    """
+    if bustype == "socketcand":
+        # Frames bridged over TCP: turn off Nagle and delayed ACKs so setpoints aren't held back
+        kwargs.setdefault("tcp_tune", True)
+    bus = can.interface.Bus(channel, bustype=bustype, receive_own_messages=False, **kwargs)
+
+    # Enlarge the SocketCAN socket buffers; the kernel defaults drop frames under burst
+    sock = getattr(bus, "socket", None)
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        except OSError as e:
+            print(f"[WARNING] Could not enlarge CAN socket buffers: {e}")
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_PRIORITY, socket_priority)
+        except (AttributeError, OSError) as e:
+            print(f"[WARNING] Could not raise CAN socket priority to {socket_priority}: {e}")
+            # Without CAP_NET_ADMIN, settle for the default rather than the kernel's priority 0
+            if socket_priority > SOCKET_PRIORITY:
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_PRIORITY, SOCKET_PRIORITY)
+                except (AttributeError, OSError):
+                    pass
+    return bus
+
+def get_bus(channel="can0", bustype="socketcan", socket_priority=SOCKET_PRIORITY, **kwargs):
+    """
+    Returns the shared CAN bus, opening it on first use.
+    """
+    global _bus
+    if _bus is None:
+        _bus = open_bus(channel, bustype, socket_priority, **kwargs)
+    return _bus
+
+def shutdown_bus():
+    """
+    Shuts down the shared CAN bus, if open, and forgets any cached discovery results.
+    """
+    global _bus
+    if _bus is not None:
+        _bus.shutdown()
+        invalidate_node_ids(_bus)
+        _bus = None
+
+def invalidate_node_ids(bus=None):
+    """
+    Drops cached discovery results for one bus, or for every bus if none is given.
+    """
+    if bus is None:
+        _discovery_cache.clear()
+    else:
+        _discovery_cache.pop(id(bus), None)
+
 def extract_node_id(arbitration_id):
     """
     Extracts the node ID from a CAN arbitration ID.
     """
     return arbitration_id >> 5
 
-def discover_node_ids(bus, discovery_duration=0.5):
+def load_cached_node_ids():
     """
-    Discover ODrive node IDs on the CAN network.
+    Returns the node set saved by a recent discovery in any process, or an empty set if stale or missing.
     """
-    while bus.recv(timeout=0) is not None:
+    try:
+        if time.time() - os.path.getmtime(NODE_CACHE_PATH) >= NODE_CACHE_MAX_AGE:
+            return set()
+        with open(NODE_CACHE_PATH, 'r') as f:
+            return set(json.load(f))
+    except (OSError, ValueError, TypeError):
+        return set()
+
+def save_cached_node_ids(node_ids):
+    """
+    Saves a discovered node set for later tool invocations; failures are ignored.
+    """
+    try:
+        os.makedirs(os.path.dirname(NODE_CACHE_PATH), exist_ok=True)
+        with open(NODE_CACHE_PATH, 'w') as f:
+            json.dump(sorted(node_ids), f)
+    except OSError:
         pass
-    end_time = time.time() + discovery_duration
-    node_ids = set()
 
-    while time.time() < end_time:
+@contextmanager
+def receive_filter(bus, can_id, can_mask=0x7FF):
+    """
+    Lets only matching standard frames through the kernel socket filter for the duration of the block.
+    The bus's previous filters are put back on exit, so blocks can nest inside a caller's own filter.
+    Frames already queued before entry are still delivered, so callers keep checking ids.
+    """
+    previous = bus.filters
+    bus.set_filters([{"can_id": can_id, "can_mask": can_mask, "extended": False}])
+    try:
+        yield
+    finally:
+        bus.set_filters(previous)
+
+def discover_node_ids(bus, discovery_duration=0.5, max_age=5.0, rescan=False, expected_count=None):
+    """
+    Discover ODrive node IDs on the CAN network.
+    Results are reused for max_age seconds; call invalidate_node_ids() to force a new scan.
+    If a recent run saved its node set, the scan ends as soon as all of those nodes have been heard,
+    unless rescan is requested, either as an argument or with ODRIVE_RESCAN=1.
+    With expected_count, or ODRIVE_NODE_COUNT, the scan also ends once that many nodes have been heard.
+    """
+    rescan = rescan or os.environ.get(NODE_RESCAN_ENV) == "1"
+    if expected_count is None:
         try:
-            msg = bus.recv(timeout=0)
-            if msg:
-                node_id = extract_node_id(msg.arbitration_id)
-                node_ids.add(node_id)
-        except can.CanError:
+            expected_count = int(os.environ[NODE_COUNT_ENV])
+        except (KeyError, ValueError):
             pass
+    cached = _discovery_cache.get(id(bus))
+    if cached and not rescan and time.monotonic() - cached[0] < max_age:
+        return list(cached[1])
 
+    # A full scan is the only way to notice nodes that joined since the set was saved
+    expected = set() if rescan else load_cached_node_ids()
+
+    # Only heartbeats identify a node; let the kernel drop every other frame
+    with receive_filter(bus, HEARTBEAT, 0x1F):
+        while bus.recv(timeout=0) is not None:
+            pass
+        end_time = time.monotonic() + discovery_duration
+        node_ids = set()
+        full_scan = True  # False once the scan ends early on a saved or counted node set
+
+        while True:
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                msg = bus.recv(timeout=remaining)
+                if msg:
+                    node_ids.add(msg.arbitration_id >> 5)  # extract_node_id, inlined for the hot loop
+                    if expected and expected <= node_ids:
+                        full_scan = False
+                        break  # Every recently seen node is still there
+                    if expected_count and len(node_ids) >= expected_count:
+                        full_scan = False
+                        break  # Every node the rig is known to have has answered
+            except can.CanError:
+                pass
+
+    # An early exit only confirms the saved set; rewriting it would keep extending its expiry,
+    # so a node that missed one full scan could go on being skipped without a warning
+    if full_scan or not node_ids <= expected:
+        save_cached_node_ids(node_ids)
+    _discovery_cache[id(bus)] = (time.monotonic(), tuple(node_ids))
     return list(node_ids)
 
+@lru_cache(maxsize=None)
+def get_struct(data_format):
+    """
+    Returns a compiled struct.Struct for a format string, built once per format.
+    """
+    return struct.Struct(data_format)
+
 def send_can_message(bus, node_id, command_id, data_format, *data_args):
     """
     Sends a CAN message.
+    One frame per (node_id, command_id) is reused, its payload packed into the existing buffer rather than allocated.
     """
     try:
-        message = can.Message(
-            arbitration_id=(node_id << 5 | command_id),
-            data=struct.pack(data_format, *data_args),
-            is_extended_id=False,
-        )
+        key = (node_id, command_id)
+        message = _message_cache.get(key)
+        if message is None:
+            message = _message_cache[key] = build_can_message(node_id, command_id, data_format, *data_args)
+        else:
+            packer = get_struct(data_format)
+            if message.dlc != packer.size:
+                # Same command with a different layout, e.g. an SDO write after a read
+                message.data = bytearray(packer.size)
+                message.dlc = packer.size
+            packer.pack_into(message.data, 0, *data_args)
         bus.send(message)
         return True
     except can.CanError:
         return False
 
+def build_can_message(node_id, command_id, data_format, *data_args):
+    """
+    Builds a CAN message without sending it.
+    """
+    return can.Message(
+        arbitration_id=(node_id << 5 | command_id),
+        data=get_struct(data_format).pack(*data_args),
+        is_extended_id=False,
+    )
+
+def send_can_messages(bus, messages):
+    """
+    Sends several CAN messages back-to-back, with no reads in between.
+    """
+    try:
+        for message in messages:
+            bus.send(message)
+        return True
+    except can.CanError:
+        return False
+
 def receive_can_message(bus, expected_arbitration_id):
     """
-    Receives a CAN message with a global timeout of 2 milliseconds.
+    Receives a CAN message with a global timeout of 50 milliseconds.
     """
-    start_time = time.time()
-    while time.time() - start_time < 0.05:
+    end_time = time.monotonic() + 0.05
+    while True:
+        remaining = end_time - time.monotonic()
+        if remaining <= 0:
+            return None  # Timeout reached
         try:
-            msg = bus.recv(timeout=0)  # Explicit timeout per receive attempt
-            if msg and msg.arbitration_id == expected_arbitration_id:
-                return msg
+            # Block in the kernel for the rest of the window instead of spinning on recv(timeout=0)
+            msg = bus.recv(timeout=remaining)
         except can.CanError:
             return None
-
-    # Timeout reached, return None
-    return None
+        if msg is None:
+            return None
+        if msg.arbitration_id == expected_arbitration_id:
+            return msg
@@ -1,8 +1,19 @@
 # odrive_configurator.py
+import ast
 import json
 import os
 import struct
-from src.can_utils import send_can_message, receive_can_message
+import sys
+import time
+from collections import deque
+from functools import lru_cache
+from types import MappingProxyType
+import can
+try:
+    import orjson  # Optional; parses the endpoints file several times faster than json
+except ImportError:
+    orjson = None
+from src.can_utils import send_can_message, receive_can_message, receive_filter, get_struct, TX_BURST_LIMIT
 
 # Constants for ODrive CAN operations
 READ  = 0x00
@@ -10,6 +21,8 @@ RXSDO = 0x04
 TXSDO = 0x05
 WRITE = 0x01
 
+TX_DRAIN_TIME = 0.005  # seconds; ample for TX_BURST_LIMIT frames to leave the queue, even at 250 kbit/s
+
 # Data type formats for CAN messages
 format_lookup = {
     'bool': '?', 'uint8': 'B', 'int8': 'b',
@@ -17,52 +30,143 @@ format_lookup = {
     'uint64': 'Q', 'int64': 'q', 'float': 'f'
 }
 
+# Compiled SDO layouts: the opcode/endpoint/reserved header, full frames per endpoint type,
+# and the bare value each type holds at byte offset 4
+SDO_HEADER = get_struct('<BHB')
+SDO_STRUCTS = {endpoint_type: get_struct('<BHB' + fmt) for endpoint_type, fmt in format_lookup.items()}
+SDO_VALUE_STRUCTS = {endpoint_type: get_struct('<' + fmt) for endpoint_type, fmt in format_lookup.items()}
+
+@lru_cache(maxsize=1)
 def load_configuration():
-    # Load the configuration file
+    # Load the configuration file once per process; the shared result is returned read-only
     script_dir = os.path.dirname(os.path.abspath(__file__))
     config_path = os.path.join(script_dir, '..', 'data', 'config.py')
 
-    config = {}
+    # config.py is a single commented literal; evaluate it as data rather than running it as code
     with open(config_path, 'r') as config_file:
-        exec(config_file.read(), globals(), config)
+        tree = ast.parse(config_file.read(), config_path)
+    config = {
+        target.id: ast.literal_eval(node.value)
+        for node in tree.body if isinstance(node, ast.Assign)
+        for target in node.targets if isinstance(target, ast.Name)
+    }
 
-    return config['config']
+    return MappingProxyType({
+        motor_type: MappingProxyType({
+            key: tuple((sys.intern(path), value) for path, value in settings)
+            for key, settings in motor_config.items()
+        })
+        for motor_type, motor_config in config['config'].items()
+    })
 
+@lru_cache(maxsize=1)
 def load_endpoints():
-    # Load the endpoints file
+    # Load the endpoints file once per process; callers share the result and must not mutate it
     script_dir = os.path.dirname(os.path.abspath(__file__))
     endpoints_path = os.path.join(script_dir, '..', 'data', 'flat_endpoints.json')
 
-    with open(endpoints_path, 'r') as f:
-        endpoints = json.load(f)
+    with open(endpoints_path, 'rb') as f:
+        endpoints = orjson.loads(f.read()) if orjson else json.load(f)
 
     return endpoints
 
+def index_endpoints(endpoints):
+    """
+    Flattens the endpoints file into a {path: (id, type)} lookup table.
+    Paths are interned, as are config setting paths, so lookups by a config path compare by identity.
+    """
+    return {sys.intern(path): (info['id'], info['type']) for path, info in endpoints['endpoints'].items()}
+
 def read_config(bus, node_id, endpoint_id, endpoint_type):
-    send_can_message(bus, node_id, RXSDO, '<BHB', READ, endpoint_id, 0)
-    response = receive_can_message(bus, node_id << 5 | TXSDO)
+    reply_id = node_id << 5 | TXSDO
+    # Only this node's SDO replies wake the receive loop; heartbeats and telemetry stay in the kernel
+    with receive_filter(bus, reply_id):
+        send_can_message(bus, node_id, RXSDO, '<BHB', READ, endpoint_id, 0)
+        response = receive_can_message(bus, reply_id)
 
     if response:
-        _, _, _, value = struct.unpack_from('<BHB' + format_lookup[endpoint_type], response.data)
+        _, _, _, value = SDO_STRUCTS[endpoint_type].unpack_from(response.data)
         return value
     return None
 
+def read_configs(bus, node_id, reads, timeout=0.2, limit=TX_BURST_LIMIT):
+    """
+    Reads several endpoints from one node; reads is a sequence of (endpoint_id, endpoint_type).
+    At most limit reads are in flight, the next sent as each reply arrives, so the burst fits the TX queue.
+    Returns {endpoint_id: value} for every endpoint that answered before the timeout.
+    """
+    reply_id = node_id << 5 | TXSDO
+    queue = deque(reads)
+    values = {}
+    with receive_filter(bus, reply_id):
+        pending = {}
+        end_time = time.monotonic() + timeout
+        while True:
+            # Top up the reads in flight; a refused send stays queued for the next reply
+            while queue and len(pending) < limit:
+                endpoint_id, endpoint_type = queue[0]
+                if not send_can_message(bus, node_id, RXSDO, '<BHB', READ, endpoint_id, 0):
+                    break
+                queue.popleft()
+                pending[endpoint_id] = endpoint_type
+            if not pending:
+                break  # Everything answered, or nothing could be sent
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                msg = bus.recv(timeout=remaining)
+            except can.CanError:
+                break
+            if msg is None:
+                break
+            if msg.arbitration_id != reply_id or len(msg.data) < 4:
+                continue
+
+            _, endpoint_id, _ = SDO_HEADER.unpack_from(msg.data)
+            endpoint_type = pending.pop(endpoint_id, None)
+            if endpoint_type is not None:
+                values[endpoint_id], = SDO_VALUE_STRUCTS[endpoint_type].unpack_from(msg.data, 4)
+    return values
+
+def config_matches(actual_value, expected_value, tolerance=1e-2):
+    if isinstance(expected_value, float) or isinstance(actual_value, float):
+        return abs(actual_value - expected_value) <= tolerance
+    return actual_value == expected_value
+
 def write_config(bus, node_id, endpoint_id, endpoint_type, value):
     # Send the CAN message
     message_format = '<BHB' + format_lookup[endpoint_type]
-    send_can_message(bus, node_id, RXSDO, message_format, WRITE, endpoint_id, 0, value)
+    return send_can_message(bus, node_id, RXSDO, message_format, WRITE, endpoint_id, 0, value)
+
+def write_configs(bus, node_id, writes, limit=TX_BURST_LIMIT):
+    """
+    Writes several endpoints on one node; writes is a sequence of (endpoint_id, endpoint_type, value).
+    Writes get no reply, so after every limit frames the TX queue is given time to drain,
+    and a refused send is retried once after another pause.
+    Returns the endpoint ids whose write was sent.
+    """
+    sent = set()
+    for i, (endpoint_id, endpoint_type, value) in enumerate(writes):
+        if i and i % limit == 0:
+            time.sleep(TX_DRAIN_TIME)
+        if write_config(bus, node_id, endpoint_id, endpoint_type, value):
+            sent.add(endpoint_id)
+        else:
+            time.sleep(TX_DRAIN_TIME)
+            if write_config(bus, node_id, endpoint_id, endpoint_type, value):
+                sent.add(endpoint_id)
+    return sent
 
 def validate_config(bus, node_id, endpoint_id, endpoint_type, expected_value, tolerance=1e-2):
+    # Returns (matches, actual_value); actual_value is None if the node did not reply
     actual_value = read_config(bus, node_id, endpoint_id, endpoint_type)
 
     if actual_value is None:
         print(f"[ERROR] Node {node_id} - No response for endpoint {endpoint_id}")
-        return False
+        return False, None
 
-    if isinstance(expected_value, float):
-        return abs(actual_value - expected_value) <= tolerance
-    else:
-        return actual_value == expected_value
+    return config_matches(actual_value, expected_value, tolerance), actual_value
 
 def save_config(bus, node_id, save_endpoint_id):
     # Send a command to save the current configuration on an ODrive node
@@ -83,7 +187,7 @@ def check_firmware_hardware_version(bus, node_id, fw_version_expected, hw_versio
     else:
         print(f"[ERROR] No response received when checking firmware and hardware version for node {node_id}.")
 
-def clear_errors(bus, node_id, endpoints, clear=True):
+def clear_errors(bus, node_id, endpoint_index, clear=True):
     # List of endpoint paths based on ODrive documentation
     error_endpoints = [
         "axis0.active_errors",        # Active errors on the axis
@@ -92,84 +196,113 @@ def clear_errors(bus, node_id, endpoints, clear=True):
 
     # Clears or reads errors for the specified ODrive node.
     for error_endpoint in error_endpoints:
-        if error_endpoint in endpoints['endpoints']:
-            endpoint_id = endpoints['endpoints'][error_endpoint]['id']
-            endpoint_type = endpoints['endpoints'][error_endpoint]['type']
+        if error_endpoint in endpoint_index:
+            endpoint_id, endpoint_type = endpoint_index[error_endpoint]
+
+            # Clearing is idempotent, so skip the read and write 0 straight away
+            if clear and "active_errors" in error_endpoint:  # Only clear active errors
+                write_config(bus, node_id, endpoint_id, endpoint_type, 0)
+                print(f"Node {node_id} - {error_endpoint} - Error cleared.")
+                print()
+                continue
+
             error_value = read_config(bus, node_id, endpoint_id, endpoint_type)
 
             if error_value:
                 print(f"Node {node_id} - {error_endpoint} - Error: {error_value}")
-                if clear and "active_errors" in error_endpoint:  # Only clear active errors
-                    write_config(bus, node_id, endpoint_id, endpoint_type, 0)
-                    print(f"Node {node_id} - {error_endpoint} - Error cleared.")
             else:
                 print(f"Node {node_id} - {error_endpoint} - No error.")
         else:
             print(f"Endpoint {error_endpoint} not found in the provided endpoints.")
         print()            
 
-def set_odrive_parameter(bus, node_id, path, value, endpoints, tolerance=1e-2):
+def set_odrive_parameter(bus, node_id, path, value, endpoint_index, tolerance=1e-2, skip_read=False):
     """
     Sets a single parameter on an ODrive node with validation.
+    With skip_read the current value is not checked first; the write is always issued.
     """
-    endpoint_id = endpoints['endpoints'][path]['id']
-    endpoint_type = endpoints['endpoints'][path]['type']
+    endpoint_id, endpoint_type = endpoint_index[path]
 
-    current_value = read_config(bus, node_id, endpoint_id, endpoint_type)
-    if current_value is None:
-        print(f"[ERROR] Node {node_id} - {path:50} - Failed to read current value.")
-        return False
+    current_value = None
+    if not skip_read:
+        current_value = read_config(bus, node_id, endpoint_id, endpoint_type)
+        if current_value is None:
+            print(f"[ERROR] Node {node_id} - {path:50} - Failed to read current value.")
+            return False
 
     # Compare with tolerance for floats
-    if isinstance(current_value, float):
-        if abs(current_value - value) <= tolerance:
-            print(f"[INFO] Node {node_id} - {path:50} - Already set: {current_value:.6f}")
-            return True
-    elif current_value == value:
-        print(f"[INFO] Node {node_id} - {path:50} - Already set: {current_value}")
+    if current_value is not None and config_matches(current_value, value, tolerance):
+        shown = f"{current_value:.6f}" if isinstance(current_value, float) else current_value
+        print(f"[INFO] Node {node_id} - {path:50} - Already set: {shown}")
         return True
 
     # Write and validate
     write_config(bus, node_id, endpoint_id, endpoint_type, value)
-    if not validate_config(bus, node_id, endpoint_id, endpoint_type, value, tolerance):
-        print(f"[ERROR] Node {node_id} - {path:50} - Update failed: Expected {value}, Got {current_value}")
+    matches, actual_value = validate_config(bus, node_id, endpoint_id, endpoint_type, value, tolerance)
+    if not matches:
+        print(f"[ERROR] Node {node_id} - {path:50} - Update failed: Expected {value}, Got {actual_value}")
         return False
 
     print(f"[INFO] Node {node_id} - {path:50} - Updated: {value}")
     return True
 
 
-def setup_odrive(bus, node_id, settings, endpoints):
+def setup_odrive(bus, node_id, settings, endpoint_index, tolerance=1e-2, skip_read=False, burst_limit=TX_BURST_LIMIT):
     """
-    Configures an entire ODrive node using provided settings.
+    Configures an entire ODrive node using provided settings, a sequence of (path, value) pairs.
+    Current values are read in one pipelined pass, differing settings are written in bursts sized to
+    the TX queue and then verified the same way. Any setting lost along the way, including a write
+    the bus refused, is retried through set_odrive_parameter().
+    With skip_read, e.g. on a freshly flashed node, every setting is written without the initial read.
+    burst_limit caps the frames queued at once; senders sharing the TX queue split TX_BURST_LIMIT between them.
     """
     try:
-        for setting in settings:
-            path = setting['path']
-            value = setting['value']
-            if not set_odrive_parameter(bus, node_id, path, value, endpoints):
+        targets = [(path, value) + endpoint_index[path] for path, value in settings]
+
+        current = {} if skip_read else read_configs(
+            bus, node_id, [(eid, ety) for _, _, eid, ety in targets], limit=burst_limit
+        )
+        written = []
+        for path, value, endpoint_id, endpoint_type in targets:
+            current_value = current.get(endpoint_id)
+            if skip_read:
+                written.append((path, value, endpoint_id, endpoint_type))
+            elif current_value is None:
+                if not set_odrive_parameter(bus, node_id, path, value, endpoint_index, tolerance):
+                    print(f"[ERROR] Failed to apply setting {path} to node {node_id}")
+                    return False
+            elif config_matches(current_value, value, tolerance):
+                shown = f"{current_value:.6f}" if isinstance(current_value, float) else current_value
+                print(f"[INFO] Node {node_id} - {path:50} - Already set: {shown}")
+            else:
+                written.append((path, value, endpoint_id, endpoint_type))
+
+        sent = write_configs(bus, node_id, [(eid, ety, value) for _, value, eid, ety in written], burst_limit)
+        actual = read_configs(
+            bus, node_id, [(eid, ety) for _, _, eid, ety in written if eid in sent], limit=burst_limit
+        )
+        for path, value, endpoint_id, endpoint_type in written:
+            actual_value = actual.get(endpoint_id)
+            if actual_value is not None and config_matches(actual_value, value, tolerance):
+                print(f"[INFO] Node {node_id} - {path:50} - Updated: {value}")
+            elif not set_odrive_parameter(bus, node_id, path, value, endpoint_index, tolerance, skip_read):
                 print(f"[ERROR] Failed to apply setting {path} to node {node_id}")
                 return False
 
         # Save the configuration
-        save_endpoint_id = endpoints['endpoints']['save_configuration']['id']
+        save_endpoint_id, _ = endpoint_index['save_configuration']
         save_config(bus, node_id, save_endpoint_id)
         return True
     except Exception as e:
         print(f"[ERROR] Unexpected error during ODrive setup: {e}")
         return False
 
-def get_motor_type(bus, node_id, endpoints):
+def get_motor_type(bus, node_id, endpoint_index):
     """
     Determine the motor type based on the pole pairs configured on the ODrive node.
     """
     try:
-        pole_pairs = read_config(
-            bus,
-            node_id,
-            endpoints["endpoints"]["axis0.config.motor.pole_pairs"]["id"],
-            endpoints["endpoints"]["axis0.config.motor.pole_pairs"]["type"]
-        )
+        pole_pairs = read_config(bus, node_id, *endpoint_index["axis0.config.motor.pole_pairs"])
         if pole_pairs == 20:
             return "8308"
         elif pole_pairs == 7:
@@ -1,38 +1,133 @@
-from src.can_utils import send_can_message
+import logging
+import time
+import can
+from src.can_utils import send_can_message, send_can_messages, build_can_message, get_struct
 from src.configure import read_config
 
+log = logging.getLogger(__name__)
+
 def set_idle_mode(bus, node_id):
     try:
-        return send_can_message(bus, node_id, 0x07, '<I', 1)  # 0x07: Set_Axis_State, 1: AxisState.IDLE
+        sent = send_can_message(bus, node_id, 0x07, '<I', 1)  # 0x07: Set_Axis_State, 1: AxisState.IDLE
+    except Exception as e:
+        log.warning("Error setting idle mode for ODrive %s: %s", node_id, e)
+        return False
+    if not sent:
+        log.warning("Could not send idle mode to ODrive %s", node_id)
+    return sent
+
+def set_idle_modes(bus, node_ids):
+    """
+    Sends Set_Axis_State IDLE to several nodes in one burst.
+    """
+    try:
+        sent = send_can_messages(bus, [build_can_message(node_id, 0x07, '<I', 1) for node_id in node_ids])
     except Exception as e:
-        print(f"Error setting idle mode for ODrive {node_id}: {e}")
+        log.warning("Error setting idle mode for ODrives %s: %s", list(node_ids), e)
         return False
+    if not sent:
+        log.warning("Could not send idle mode to ODrives %s", list(node_ids))
+    return sent
 
 def set_closed_loop_control(bus, node_id):
     try:
-        return send_can_message(bus, node_id, 0x07, '<I', 8)  # 0x07: Set_Axis_State, 8: AxisState.CLOSED_LOOP_CONTROL
+        sent = send_can_message(bus, node_id, 0x07, '<I', 8)  # 0x07: Set_Axis_State, 8: AxisState.CLOSED_LOOP_CONTROL
     except Exception as e:
-        print(f"Error setting closed loop control for ODrive {node_id}: {e}")
+        log.warning("Error setting closed loop control for ODrive %s: %s", node_id, e)
         return False
+    if not sent:
+        log.warning("Could not send closed loop control to ODrive %s", node_id)
+    return sent
+
+def set_closed_loop_controls(bus, node_ids):
+    """
+    Sends Set_Axis_State CLOSED_LOOP_CONTROL to several nodes in one burst.
+    """
+    try:
+        sent = send_can_messages(bus, [build_can_message(node_id, 0x07, '<I', 8) for node_id in node_ids])
+    except Exception as e:
+        log.warning("Error setting closed loop control for ODrives %s: %s", list(node_ids), e)
+        return False
+    if not sent:
+        log.warning("Could not send closed loop control to ODrives %s", list(node_ids))
+    return sent
 
 def move_odrive_to_position(bus, node_id, position):
     try:
-        return send_can_message(bus, node_id, 0x0c, '<fhh', position, 0, 0)  # 0x0c: Set_Input_Position
+        sent = send_can_message(bus, node_id, 0x0c, '<fhh', position, 0, 0)  # 0x0c: Set_Input_Position
+    except Exception as e:
+        log.warning("Error moving ODrive %s to position %s: %s", node_id, position, e)
+        return False
+    if not sent:
+        log.warning("Could not send position %s to ODrive %s", position, node_id)
+    return sent
+
+def make_position_message(node_id):
+    """
+    Pre-builds a reusable Set_Input_Position frame for a node; fill it with set_position_message().
+    """
+    return can.Message(arbitration_id=(node_id << 5 | 0x0c), data=bytearray(8), is_extended_id=False)
+
+def set_position_message(message, position):
+    """
+    Writes a new target position into a frame from make_position_message(), in place.
+    """
+    get_struct('<fhh').pack_into(message.data, 0, position, 0, 0)
+    return message
+
+def move_odrives_to_positions(bus, targets):
+    """
+    Sends Set_Input_Position to several nodes in one burst. targets is a list of (node_id, position).
+    """
+    try:
+        messages = [build_can_message(node_id, 0x0c, '<fhh', position, 0, 0) for node_id, position in targets]
+        sent = send_can_messages(bus, messages)
     except Exception as e:
-        print(f"Error moving ODrive {node_id} to position {position}: {e}")
+        log.warning("Error moving ODrives %s: %s", [node_id for node_id, _ in targets], e)
         return False
+    if not sent:
+        log.warning("Could not send positions to ODrives %s", [node_id for node_id, _ in targets])
+    return sent
+
+def wait_until_settled(bus, node_ids, target=0.0, timeout=2.0, tolerance=0.05):
+    """
+    Waits until every node's broadcast encoder estimate (0x09) is within tolerance of target and at rest.
+    Returns True once all nodes have settled, or False if the timeout expires first.
+    """
+    encoder_ids = {node_id << 5 | 0x09: node_id for node_id in node_ids}
+    unsettled = set(node_ids)
+    unpack = get_struct('<ff').unpack_from
+
+    end_time = time.monotonic() + timeout
+    while unsettled:
+        remaining = end_time - time.monotonic()
+        if remaining <= 0:
+            return False
+        try:
+            msg = bus.recv(timeout=remaining)
+        except can.CanError:
+            return False
+        if msg is None or msg.arbitration_id not in encoder_ids or len(msg.data) < 8:
+            continue
+
+        pos, vel = unpack(msg.data)
+        if abs(pos - target) < tolerance and abs(vel) < tolerance:
+            unsettled.discard(encoder_ids[msg.arbitration_id])
+    return True
 
 def move_odrive_with_torque(bus, node_id, torque):
     try:
-        return send_can_message(bus, node_id, 0x0e, '<f', torque)  # 0x0d: Set_Input_Torque
+        sent = send_can_message(bus, node_id, 0x0e, '<f', torque)  # 0x0d: Set_Input_Torque
     except Exception as e:
-        print(f"Error applying torque to ODrive {node_id}: {e}")
+        log.warning("Error applying torque to ODrive %s: %s", node_id, e)
         return False
+    if not sent:
+        log.warning("Could not send torque %s to ODrive %s", torque, node_id)
+    return sent
 
-def get_control_mode(bus, node_id, endpoints):
+def get_control_mode(bus, node_id, endpoint_index):
     """
     Retrieves the control mode (1: position, 2: velocity, 3: torque) for the specified node.
     """
-    control_mode_id = endpoints["endpoints"]["axis0.controller.config.control_mode"]["id"]
-    control_mode_type = endpoints["endpoints"]["axis0.controller.config.control_mode"]["type"]
+    control_mode_id, control_mode_type = endpoint_index["axis0.controller.config.control_mode"]
     return read_config(bus, node_id, control_mode_id, control_mode_type)
\ No newline at end of file
@@ -1,4 +1,11 @@
-from src.configure import read_config
+import logging
+import time
+from collections import deque
+import can
+from src.can_utils import send_can_message, extract_node_id, get_struct, TX_BURST_LIMIT, TX_QUEUE_LENGTH
+from src.configure import READ, RXSDO, TXSDO, SDO_HEADER, SDO_VALUE_STRUCTS
+
+log = logging.getLogger(__name__)
 
 # Metric endpoints for extensibility
 METRIC_ENDPOINTS = {
@@ -17,21 +24,270 @@ METRIC_ENDPOINTS = {
     "disarm_msg":    "axis0.disarm_reason"
 }
 
-def get_metrics(bus, node_id, endpoints):
+# Column order and display widths, in METRIC_ENDPOINTS order, for table renderers
+METRIC_NAMES = tuple(METRIC_ENDPOINTS)
+METRIC_WIDTHS = tuple(max(len(name), 4) + 3 for name in METRIC_NAMES)
+
+# Cyclic messages each ODrive broadcasts on its own (rates set in data/config.py),
+# mapped to the metric carried by each payload field; None marks fields not shown. Get_Torques'
+# target is the controller's torque_setpoint, not the input_torque tor_tgt shows, so that is polled
+CYCLIC_METRICS = {
+    0x03: ('<II', (None, "disarm_msg")),              # Get_Error: active_errors, disarm_reason
+    0x09: ('<ff', ("pos", "vel")),                    # Get_Encoder_Estimates
+    0x17: ('<ff', ("volts", "amps")),                 # Get_Bus_Voltage_Current
+    0x1C: ('<ff', (None, "tor (Nm)")),                # Get_Torques: torque_setpoint, estimate
+}
+CYCLIC_METRIC_NAMES = frozenset(
+    name for _, names in CYCLIC_METRICS.values() for name in names if name
+)
+# Refreshes a cyclic metric may go unheard before it is polled over SDO instead, e.g. when
+# setup.py has not enabled that broadcast on a node; also the head start broadcasts get at startup
+CYCLIC_GRACE_REFRESHES = 2
+# Seconds a metric read may go unanswered before its send slot is given to the next read;
+# an ODrive answers within a few ms, so only a node that has gone quiet holds a slot this long
+METRIC_READ_TIMEOUT = 0.02
+
+# Metrics table layout and pre-parsed %-templates per column, shared by the front ends;
+# positives get a leading space so signs line up
+NODE_COL_WIDTH = 6
+METRICS_HEADER = f"{'Node':<{NODE_COL_WIDTH}}" + "".join(
+    f"{name:<{width}}" for name, width in zip(METRIC_NAMES, METRIC_WIDTHS)
+)
+NODE_FORMAT = "%%-%dd" % NODE_COL_WIDTH
+POSITIVE_FORMATS = tuple(" %%-%d.2f" % (width - 1) for width in METRIC_WIDTHS)
+NEGATIVE_FORMATS = tuple("%%-%d.2f" % width for width in METRIC_WIDTHS)
+NONE_CELLS = tuple(f"{'None':<{width}}" for width in METRIC_WIDTHS)  # None or non-numeric
+
+def decode_cyclic_metrics(msg):
     """
-    Retrieves all metrics for a specific ODrive node.
-    Returns a dictionary of metrics with values or None for failed metrics.
+    Decodes a cyclic telemetry frame into the metrics it carries.
+    Returns (node_id, {metric_name: value}), or None if the frame is not a known broadcast.
     """
-    metrics = {}
+    entry = CYCLIC_METRICS.get(msg.arbitration_id & 0x1F)
+    if entry is None or len(msg.data) < 8:
+        return None
+
+    data_format, names = entry
+    values = get_struct(data_format).unpack_from(msg.data)
+    return extract_node_id(msg.arbitration_id), {name: v for name, v in zip(names, values) if name}
+
+def queue_metric_reads(node_ids, endpoint_index, skip=None):
+    """
+    Lists the read requests for every metric on every node, as (node_id, endpoint_id, metric_name, endpoint_type).
+    skip maps a node to metrics not to request from it, e.g. the cyclic metrics it is broadcasting.
+    Reads are interleaved across nodes, so a node that stops replying holds at most a few send slots.
+    """
+    queue = deque()
     for metric_name, endpoint_key in METRIC_ENDPOINTS.items():
         try:
-            metrics[metric_name] = read_config(
-                bus,
-                node_id,
-                endpoints["endpoints"][endpoint_key]["id"],
-                endpoints["endpoints"][endpoint_key]["type"]
-            )
-        except Exception as e:
-            print(f"[ERROR] Failed to retrieve {metric_name} for node {node_id}: {e}")
-            metrics[metric_name] = "None"
-    return metrics
\ No newline at end of file
+            endpoint_id, endpoint_type = endpoint_index[endpoint_key]
+        except KeyError as e:
+            log.debug("Failed to retrieve %s: %s", metric_name, e)
+            continue
+        for node_id in node_ids:
+            if not skip or metric_name not in skip[node_id]:
+                queue.append((node_id, endpoint_id, metric_name, endpoint_type))
+    return queue
+
+def submit_metric_reads(bus, queue, pending, limit=TX_BURST_LIMIT):
+    """
+    Sends queued reads until limit of them await a reply, adding each to pending as
+    (node_id, endpoint_id) -> (metric_name, endpoint_type, deadline); call again as replies arrive.
+    A read the bus refuses, e.g. with ENOBUFS, stays queued and is retried on the next call.
+    Reads unanswered past their deadline are dropped from pending to free their slot.
+    Returns the dropped reads as (node_id, metric_name) pairs.
+    """
+    now = time.monotonic()
+    expired = [key for key, (_, _, deadline) in pending.items() if deadline <= now]
+    lost = [(key[0], pending.pop(key)[0]) for key in expired]
+
+    while queue and len(pending) < limit:
+        node_id, endpoint_id, metric_name, endpoint_type = queue[0]
+        if not send_can_message(bus, node_id, RXSDO, '<BHB', READ, endpoint_id, 0):
+            log.debug("Could not send read of %s to node %s; left queued", metric_name, node_id)
+            break
+        queue.popleft()
+        pending[(node_id, endpoint_id)] = (metric_name, endpoint_type, now + METRIC_READ_TIMEOUT)
+    return lost
+
+def decode_metric_response(msg, pending):
+    """
+    Matches a received frame against the pending reads, removing it once answered.
+    Returns (node_id, metric_name, value), or None if the frame is not an expected TXSDO reply.
+    """
+    if msg.arbitration_id & 0x1F != TXSDO or len(msg.data) < 4:
+        return None
+
+    node_id = extract_node_id(msg.arbitration_id)
+    _, endpoint_id, _ = SDO_HEADER.unpack_from(msg.data)
+    request = pending.pop((node_id, endpoint_id), None)
+    if request is None:
+        return None
+
+    metric_name, endpoint_type, _ = request
+    value, = SDO_VALUE_STRUCTS[endpoint_type].unpack_from(msg.data, 4)
+    return node_id, metric_name, value
+
+def collect_metric_responses(bus, node_ids, queue, timeout=0.05):
+    """
+    Sends the queued reads a few at a time, topping up as TXSDO replies arrive,
+    until every read is answered or the timeout expires.
+    Returns a dictionary of {node_id: {metric_name: value}}, with None for unanswered metrics.
+    """
+    results = {node_id: dict.fromkeys(METRIC_ENDPOINTS) for node_id in node_ids}
+    pending = {}
+    end_time = time.monotonic() + timeout
+
+    while True:
+        submit_metric_reads(bus, queue, pending)
+        if not pending and not queue:
+            break
+        remaining = end_time - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            # Wake at least once per read timeout so a quiet node's reads give up their slots
+            msg = bus.recv(timeout=min(remaining, METRIC_READ_TIMEOUT))
+        except can.CanError:
+            break
+        if msg is None:
+            continue
+
+        response = decode_metric_response(msg, pending)
+        if response:
+            node_id, metric_name, value = response
+            results[node_id][metric_name] = value
+
+    return results
+
+def get_metrics_batch(bus, node_ids, endpoint_index, timeout=0.05):
+    """
+    Retrieves all metrics for several ODrive nodes, keeping a few reads in flight at a time.
+    Returns a dictionary of {node_id: {metric_name: value}}, with None for failed metrics.
+    """
+    queue = queue_metric_reads(node_ids, endpoint_index)
+    return collect_metric_responses(bus, node_ids, queue, timeout)
+
+def get_metrics(bus, node_id, endpoint_index):
+    """
+    Retrieves all metrics for a specific ODrive node.
+    Returns a dictionary of metrics with values or None for failed metrics.
+    """
+    return get_metrics_batch(bus, [node_id], endpoint_index)[node_id]
+
+def format_metric_cells(values):
+    return [
+        (pos_fmt % val if val >= 0 else neg_fmt % val) if isinstance(val, (float,int)) else none_cell
+        for pos_fmt, neg_fmt, none_cell, val in zip(POSITIVE_FORMATS, NEGATIVE_FORMATS, NONE_CELLS, values)
+    ]
+
+def format_metric_row(node_id, values):
+    """
+    Formats one node's table row from its metric values, in METRIC_ENDPOINTS order.
+    """
+    return NODE_FORMAT % node_id + "".join(format_metric_cells(values))
+
+class MetricsCache:
+    """
+    Latest metric values per node, filled in as frames arrive on the bus.
+    Cyclic broadcasts update it directly; the remaining metrics are requested each refresh,
+    a few at a time with the next sent as each reply lands here, starting from a different node
+    every refresh so that reads cut short by the next refresh never always miss the same nodes.
+    A cyclic metric a node has stopped broadcasting, or never did, is polled like the rest.
+    A read unanswered within METRIC_READ_TIMEOUT, or not sent by the next refresh, shows as None,
+    as get_metrics_batch reports it, and so does a broadcast quiet for over CYCLIC_GRACE_REFRESHES.
+    Feed it with on_readable from an event loop watch on the bus fd.
+    """
+    def __init__(self, bus, node_ids, endpoint_index):
+        self.bus = bus
+        self.node_ids = node_ids
+        self.endpoint_index = endpoint_index
+        self.pending = {}
+        self.queue = deque()  # Reads not sent yet this refresh
+        # Leave TX queue room for a setpoint burst, at most one frame per node, sent alongside the reads
+        self.limit = max(min(TX_BURST_LIMIT, TX_QUEUE_LENGTH - len(node_ids)), 1)
+        self.values = {node_id: dict.fromkeys(METRIC_ENDPOINTS) for node_id in node_ids}
+        self.refreshes = 0
+        self.heard = {node_id: {} for node_id in node_ids}  # cyclic metric -> refresh it was last broadcast in
+        self.rendered = [None] * len(node_ids)  # Last row texts handed to update_rows' widgets
+
+    def on_readable(self):
+        # Drain every frame the socket has queued; called from the event loop
+        while True:
+            msg = self.bus.recv(timeout=0)
+            if msg is None:
+                break
+            self.on_message(msg)
+
+    def on_message(self, msg):
+        # Broadcast telemetry first; it covers the metrics that are never polled
+        cyclic = decode_cyclic_metrics(msg)
+        if cyclic:
+            node_id, metrics = cyclic
+            if node_id in self.values:
+                self.values[node_id].update(metrics)
+                self.heard[node_id].update(dict.fromkeys(metrics, self.refreshes))
+            return
+
+        response = decode_metric_response(msg, self.pending)
+        if response:
+            node_id, metric_name, value = response
+            self.values[node_id][metric_name] = value
+        if self.queue:
+            # A slot was freed, or a refused send may now fit in the TX queue
+            for node_id, metric_name in submit_metric_reads(self.bus, self.queue, self.pending, self.limit):
+                self.values[node_id][metric_name] = None
+
+    def broadcast_metrics(self, node_id):
+        """
+        Returns the cyclic metrics a node is currently broadcasting, which need no SDO read.
+        """
+        if self.refreshes <= CYCLIC_GRACE_REFRESHES:
+            return CYCLIC_METRIC_NAMES
+        return {name for name, refresh in self.heard[node_id].items()
+                if self.refreshes - refresh <= CYCLIC_GRACE_REFRESHES}
+
+    def expire_broadcasts(self):
+        """
+        Clears cyclic metrics a node has not broadcast within the grace period; they are polled from now on.
+        """
+        if self.refreshes <= CYCLIC_GRACE_REFRESHES:
+            return
+        for node_id, heard in self.heard.items():
+            stale = [name for name, refresh in heard.items()
+                     if self.refreshes - refresh > CYCLIC_GRACE_REFRESHES]
+            for name in stale:
+                del heard[name]
+                self.values[node_id][name] = None
+
+    def request(self):
+        # Replies are picked up by on_readable; nothing here waits on the bus
+        if self.queue:
+            # Routine while a node is quiet or the bus is down; the front ends draw over stderr
+            log.debug("%d metric reads were not sent before the next refresh", len(self.queue))
+        # Reads never sent last refresh failed; don't keep showing old values
+        for node_id, _, metric_name, _ in self.queue:
+            self.values[node_id][metric_name] = None
+        self.refreshes += 1
+        self.expire_broadcasts()
+        start = self.refreshes % max(len(self.node_ids), 1)
+        node_ids = self.node_ids[start:] + self.node_ids[:start]
+        skip = {node_id: self.broadcast_metrics(node_id) for node_id in node_ids}
+        self.queue = queue_metric_reads(node_ids, self.endpoint_index, skip)
+        # Frees the slots of reads that timed out, even when no frame has arrived since
+        for node_id, metric_name in submit_metric_reads(self.bus, self.queue, self.pending, self.limit):
+            self.values[node_id][metric_name] = None
+
+    def update_rows(self, rows):
+        """
+        Sets each node's formatted row on the matching text widget in rows, skipping unchanged rows
+        so they are neither invalidated nor laid out again. Returns True if any row changed.
+        """
+        changed = False
+        for i, node_id in enumerate(self.node_ids):
+            row = format_metric_row(node_id, self.values[node_id].values())
+            if row != self.rendered[i]:
+                self.rendered[i] = row
+                rows[i].set_text(row)
+                changed = True
+        return changed
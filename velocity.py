@@ -1,18 +1,18 @@
 #!/usr/bin/env python3
 
-import sys
+import argparse
+import ctypes
+import ctypes.util
+import os
 import time
-import threading
 import signal
 import urwid
-import can
 
-from src.can_utils import discover_node_ids
+from src.can_utils import discover_node_ids, get_bus, shutdown_bus
 from src.control import move_odrive_to_position, set_closed_loop_control, set_idle_mode
 
-stop_event = threading.Event()
-
 UPDATE_RATE = 30.0   # Hz
+RT_SOCKET_PRIORITY = 7  # Above open_bus' default; needs CAP_NET_ADMIN, like SCHED_FIFO needs CAP_SYS_NICE
 VELOCITY_SCALING = 3.0
 
 class VelocitySlider(urwid.WidgetWrap):
@@ -42,19 +42,74 @@ def handle_input(key, slider):
     elif key == 'down':
         slider.decrement()
     elif key == 'esc':
-        stop_event.set()
         raise urwid.ExitMainLoop()
 
-def motor_update_thread(bus, node_id, slider):
-    current_position = 0.0
-    dt = 1.0 / UPDATE_RATE
-    while not stop_event.is_set():
-        current_position += slider.value * dt
+def make_realtime(core=None, priority=None):
+    """
+    Pins the calling thread, here the one running the UI and motor updates, to a CPU core
+    and/or raises it to SCHED_FIFO at the given priority.
+    Both need suitable privileges; failures are reported and the thread keeps its defaults.
+    """
+    if core is not None:
+        try:
+            os.sched_setaffinity(0, {core})
+        except (AttributeError, OSError) as e:
+            print(f"[WARNING] Could not pin to core {core}: {e}")
+    if priority is not None:
         try:
-            move_odrive_to_position(bus, node_id, current_position)
-        except:
-            pass
-        time.sleep(dt)
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        except (AttributeError, OSError) as e:
+            print(f"[WARNING] Could not set SCHED_FIFO priority {priority}: {e}")
+
+def lock_memory():
+    # Keep current and future pages resident so motor updates never stall on a page fault
+    MCL_CURRENT, MCL_FUTURE = 1, 2
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    except (AttributeError, OSError) as e:
+        print(f"[WARNING] Could not lock process memory: {e}")
+
+class VelocityIntegrator:
+    """
+    Integrates the slider velocity into position targets from urwid alarms,
+    on the same thread as the UI, so no second thread contends for the bus or the GIL.
+    """
+    def __init__(self, bus, node_id, slider, update_rate=UPDATE_RATE):
+        self.bus = bus
+        self.node_id = node_id
+        self.slider = slider
+        self.period = 1.0 / update_rate
+        self.position = 0.0
+        self.last_sent = None
+        self.last = None
+        self.deadline = None
+
+    def start(self, loop):
+        # Ticks are paced against absolute deadlines and integrate the measured
+        # elapsed time, so alarm overshoot neither accumulates nor biases velocity
+        self.last = time.monotonic()
+        self.deadline = self.last + self.period
+        loop.set_alarm_in(self.period, self.tick)
+
+    def tick(self, loop, user_data=None):
+        now = time.monotonic()
+        self.deadline += self.period
+        if now > self.deadline:
+            # Overran by a whole period => drop the missed ticks instead of bursting
+            self.deadline = now + self.period
+        self.position += self.slider.value * (now - self.last)
+        self.last = now
+
+        # Zero velocity => the ODrive already holds this target
+        if self.position != self.last_sent:
+            try:
+                if move_odrive_to_position(self.bus, self.node_id, self.position):
+                    self.last_sent = self.position
+            except:
+                pass
+        loop.set_alarm_in(max(self.deadline - time.monotonic(), 0.0), self.tick)
 
 def clean_shutdown(bus, node_id):
     print("[INFO] Setting ODrive to IDLE...")
@@ -62,53 +117,57 @@ def clean_shutdown(bus, node_id):
         set_idle_mode(bus, node_id)
     except Exception as e:
         print(f"[WARNING] Error setting node {node_id} to IDLE: {e}")
-    bus.shutdown()
+    shutdown_bus()
 
-def main():
+def main(node_id, rt_core=None, rt_prio=None):
     signal.signal(signal.SIGINT, signal_handler)
 
-    if len(sys.argv) < 2:
-        print("Usage: python test_slider_velocity.py <node_id>")
-        return
-
-    node_id = int(sys.argv[1])
+    if rt_prio is not None:
+        lock_memory()
+    make_realtime(rt_core, rt_prio)
 
-    bus = can.interface.Bus("can0", bustype="socketcan")
+    if rt_prio is not None:
+        bus = get_bus(socket_priority=RT_SOCKET_PRIORITY)
+    else:
+        bus = get_bus()
     discovered = discover_node_ids(bus)
     if node_id not in discovered:
         print(f"[ERROR] Node {node_id} not found on CAN bus.")
-        bus.shutdown()
+        shutdown_bus()
         return
 
+    # Arrow keys arrive as escape sequences; don't hold them back waiting for more bytes.
+    # Built before the motor is armed, so a failure here can't leave it in closed loop
+    screen = urwid.raw_display.Screen()
+    screen.set_input_timeouts(complete_wait=0.01)
+
     if not set_closed_loop_control(bus, node_id):
         print(f"[ERROR] Could not set node {node_id} to CLOSED_LOOP_CONTROL.")
-        bus.shutdown()
+        shutdown_bus()
         return
 
     print(f"[INFO] Node {node_id} in CLOSED_LOOP_CONTROL (position mode).")
 
     slider = VelocitySlider()
-    ui_thread = threading.Thread(
-        target=motor_update_thread,
-        args=(bus, node_id, slider),
-        daemon=True
-    )
-    ui_thread.start()
 
     def unhandled(key):
         handle_input(key, slider)
 
-    loop = urwid.MainLoop(slider, unhandled_input=unhandled)
+    loop = urwid.MainLoop(slider, screen=screen, handle_mouse=False, unhandled_input=unhandled)
+    VelocityIntegrator(bus, node_id, slider).start(loop)
 
     try:
         loop.run()
     except KeyboardInterrupt:
         pass
     finally:
-        print("[INFO] Exiting, stopping threads...")
-        stop_event.set()
-        ui_thread.join()
+        print("[INFO] Exiting...")
         clean_shutdown(bus, node_id)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Drive one ODrive with a pseudo-velocity slider.')
+    parser.add_argument('node_id', type=int, help='CAN node id of the ODrive to drive.')
+    parser.add_argument('--rt-core', type=int, help='Pin the UI and motor update loop to this CPU core.')
+    parser.add_argument('--rt-prio', type=int, help='Run the UI and motor update loop under SCHED_FIFO at this priority (1-99), lock memory and raise the CAN socket priority.')
+    args = parser.parse_args()
+    main(args.node_id, rt_core=args.rt_core, rt_prio=args.rt_prio)
\ No newline at end of file